@@ -0,0 +1,74 @@
+"""
+Per-emit cost of observer.Event, compared with the implementation it replaced.
+
+Usage: python benchmarks/observer_emit.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyalgotrade import observer
+
+
+# observer.Event before handlers were cached in a tuple.
+class LegacyEvent(object):
+    def __init__(self):
+        self.__handlers = []
+        self.__toSubscribe = []
+        self.__toUnsubscribe = []
+        self.__emitting = False
+
+    def __applyChanges(self):
+        if len(self.__toSubscribe):
+            for handler in self.__toSubscribe:
+                if handler not in self.__handlers:
+                    self.__handlers.append(handler)
+            self.__toSubscribe = []
+
+        if len(self.__toUnsubscribe):
+            for handler in self.__toUnsubscribe:
+                self.__handlers.remove(handler)
+            self.__toUnsubscribe = []
+
+    def subscribe(self, handler):
+        if self.__emitting:
+            self.__toSubscribe.append(handler)
+        elif handler not in self.__handlers:
+            self.__handlers.append(handler)
+
+    def unsubscribe(self, handler):
+        if self.__emitting:
+            self.__toUnsubscribe.append(handler)
+        else:
+            self.__handlers.remove(handler)
+
+    def emit(self, *args, **kwargs):
+        try:
+            self.__emitting = True
+            for handler in self.__handlers:
+                handler(*args, **kwargs)
+        finally:
+            self.__emitting = False
+            self.__applyChanges()
+
+
+def emit_cost(eventClass, handlerCount, number=200000, repeat=5):
+    event = eventClass()
+    for i in range(handlerCount):
+        event.subscribe(lambda *args: None)
+    return min(timeit.repeat(lambda: event.emit(1, 2, 3), number=number, repeat=repeat)) / number
+
+
+def main():
+    print("%-10s %12s %12s" % ("handlers", "before", "after"))
+    for handlerCount in (0, 1, 3):
+        before = emit_cost(LegacyEvent, handlerCount)
+        after = emit_cost(observer.Event, handlerCount)
+        print("%-10d %10.0fns %10.0fns" % (handlerCount, before * 1e9, after * 1e9))
+
+
+if __name__ == "__main__":
+    main()
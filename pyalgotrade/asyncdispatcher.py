@@ -0,0 +1,197 @@
+# PyAlgoTrade
+#
+# Copyright 2011-2015 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+.. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
+"""
+
+import asyncio
+import queue
+
+from pyalgotrade import utils
+from pyalgotrade import observer
+from pyalgotrade import dispatchprio
+
+
+QUEUE_POLL_TIMEOUT = 1
+
+
+def is_awaitable_subject(subject):
+    return asyncio.iscoroutinefunction(getattr(subject, "nextEvent", None))
+
+
+async def get_from_queue(queue_, stopped, timeout=QUEUE_POLL_TIMEOUT):
+    """Waits for an item from a queue.Queue without blocking the event loop. The blocking get runs in the default
+    executor and times out every timeout seconds to check stopped(). Returns None if stopped() becomes True first.
+
+    .. note::
+        If the waiting task is cancelled, an item that arrives before the get times out is lost.
+    """
+    loop = asyncio.get_running_loop()
+    while not stopped():
+        try:
+            return await loop.run_in_executor(None, queue_.get, True, timeout)
+        except queue.Empty:
+            pass
+    return None
+
+
+# Same interface as dispatcher.Dispatcher, but the dispatch loop runs on asyncio instead of spinning.
+# Realtime subjects can implement a nextEvent() coroutine that returns once the subject has events to dispatch.
+# The dispatcher keeps one pending nextEvent() per such subject and sleeps until one of them finishes, so network
+# requests, websocket messages and broker updates are all waited on together instead of through queue timeouts.
+# Subjects without nextEvent() are checked as in dispatcher.Dispatcher. While any of them is alive and nothing was
+# dispatched, the dispatcher waits at most pollInterval seconds before checking them again.
+class AsyncDispatcher(object):
+    def __init__(self, pollInterval=0.01):
+        self.__subjects = []
+        self.__stop = False
+        self.__startEvent = observer.Event()
+        self.__idleEvent = observer.Event()
+        self.__currDateTime = None
+        self.__pollInterval = pollInterval
+        # subject -> pending nextEvent() task.
+        self.__tasks = {}
+        self.__loop = None
+        self.__stopFuture = None
+
+    # Returns the current event datetime. It may be None for events from realtime subjects.
+    def getCurrentDateTime(self):
+        return self.__currDateTime
+
+    def getStartEvent(self):
+        return self.__startEvent
+
+    def getIdleEvent(self):
+        return self.__idleEvent
+
+    def stop(self):
+        # This may be called from a handler or from another thread.
+        self.__stop = True
+        if self.__loop is not None and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(self.__wakeUp)
+
+    def __wakeUp(self):
+        if self.__stopFuture is not None and not self.__stopFuture.done():
+            self.__stopFuture.set_result(None)
+
+    def getSubjects(self):
+        return self.__subjects
+
+    def addSubject(self, subject):
+        # Skip the subject if it was already added.
+        if subject in self.__subjects:
+            return
+
+        # If the subject has no specific dispatch priority put it right at the end.
+        if subject.getDispatchPriority() is dispatchprio.LAST:
+            self.__subjects.append(subject)
+        else:
+            # Find the position according to the subject's priority.
+            pos = 0
+            for s in self.__subjects:
+                if s.getDispatchPriority() is dispatchprio.LAST or subject.getDispatchPriority() < s.getDispatchPriority():
+                    break
+                pos += 1
+            self.__subjects.insert(pos, subject)
+
+        subject.onDispatcherRegistered(self)
+
+    def __armSubjects(self):
+        for subject in self.__subjects:
+            if subject not in self.__tasks and is_awaitable_subject(subject) and not subject.eof():
+                self.__tasks[subject] = asyncio.ensure_future(subject.nextEvent())
+
+    # Returns True if any of the subjects without nextEvent() can still generate events.
+    def __polling(self):
+        for subject in self.__subjects:
+            if subject not in self.__tasks and not is_awaitable_subject(subject) and not subject.eof():
+                return True
+        return False
+
+    # Returns a tuple with booleans
+    # 1: True if all subjects hit eof
+    # 2: True if at least one subject dispatched events.
+    def __dispatch(self):
+        smallestDateTime = None
+        eof = True
+        eventsDispatched = False
+
+        # Scan for the lowest datetime. Subjects waiting in nextEvent() are realtime ones.
+        for subject in self.__subjects:
+            if not subject.eof():
+                eof = False
+                if subject not in self.__tasks:
+                    smallestDateTime = utils.safe_min(smallestDateTime, subject.peekDateTime())
+
+        if not eof:
+            self.__currDateTime = smallestDateTime
+
+            for subject in self.__subjects:
+                task = self.__tasks.get(subject)
+                if task is not None:
+                    # Only dispatch the subjects whose nextEvent() finished.
+                    if not task.done():
+                        continue
+                    del self.__tasks[subject]
+                    # Propagate errors raised by nextEvent().
+                    task.result()
+                if not subject.eof() and subject.peekDateTime() in (None, smallestDateTime):
+                    if subject.dispatch() is True:
+                        eventsDispatched = True
+        return eof, eventsDispatched
+
+    async def __wait(self):
+        waitFor = list(self.__tasks.values())
+        if not waitFor and not self.__polling():
+            return
+        waitFor.append(self.__stopFuture)
+        timeout = self.__pollInterval if self.__polling() else None
+        await asyncio.wait(waitFor, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    async def runAsync(self):
+        """Runs the dispatch loop in the running event loop."""
+        self.__loop = asyncio.get_running_loop()
+        self.__stopFuture = self.__loop.create_future()
+        try:
+            for subject in self.__subjects:
+                subject.start()
+
+            self.__startEvent.emit()
+
+            while not self.__stop:
+                self.__armSubjects()
+                eof, eventsDispatched = self.__dispatch()
+                if eof:
+                    self.__stop = True
+                elif not eventsDispatched:
+                    self.__idleEvent.emit()
+                    await self.__wait()
+                else:
+                    # Let other tasks run.
+                    await asyncio.sleep(0)
+        finally:
+            for task in self.__tasks.values():
+                task.cancel()
+            self.__tasks = {}
+            self.__loop = None
+            for subject in self.__subjects:
+                subject.stop()
+            for subject in self.__subjects:
+                subject.join()
+
+    def run(self):
+        asyncio.run(self.runAsync())
@@ -24,6 +24,8 @@ from pyalgotrade.barfeed import membf
 from pyalgotrade import bar
 
 import datetime
+import numpy as np
+import pandas as pd
 import pytz
 
 
@@ -44,6 +46,25 @@ class BarFilter(object):
     def includeBar(self, bar_):
         raise NotImplementedError()
 
+    # Vectorised version of includeBar used when loading whole columns. Receives a pandas.DatetimeIndex and returns
+    # a boolean array, or None if the filter needs the bars.
+    def includeBars(self, dateTimes):
+        return None
+
+
+def get_defining_class(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass
+    return None
+
+
+# A subclass that overrides includeBar but not includeBars would get the wrong vectorised filter.
+def has_vectorised_filter(barFilter):
+    cls = type(barFilter)
+    definingClass = get_defining_class(cls, "includeBars")
+    return definingClass is not BarFilter and definingClass is get_defining_class(cls, "includeBar")
+
 
 class DateRangeFilter(BarFilter):
     def __init__(self, fromDate=None, toDate=None):
@@ -57,6 +78,14 @@ class DateRangeFilter(BarFilter):
             return False
         return True
 
+    def includeBars(self, dateTimes):
+        ret = np.ones(len(dateTimes), dtype=bool)
+        if self.__toDate:
+            ret &= np.asarray(dateTimes <= self.__toDate)
+        if self.__fromDate:
+            ret &= np.asarray(dateTimes >= self.__fromDate)
+        return ret
+
 
 # US Equities Regular Trading Hours filter
 # Monday ~ Friday
@@ -86,6 +115,26 @@ class USEquitiesRTH(DateRangeFilter):
                 return False
         return ret
 
+    def includeBars(self, dateTimes):
+        ret = super(USEquitiesRTH, self).includeBars(dateTimes)
+        # Check day of week
+        ret &= np.asarray(dateTimes.dayofweek <= 4)
+
+        # Check time. Naive datetimes are localized, which keeps the time.
+        if dateTimes.tz is not None:
+            dateTimes = dateTimes.tz_convert(USEquitiesRTH.timezone)
+        barTimes = time_in_microseconds(dateTimes.hour, dateTimes.minute, dateTimes.second, dateTimes.microsecond)
+        fromTime = time_in_microseconds(self.__fromTime.hour, self.__fromTime.minute, self.__fromTime.second,
+                                        self.__fromTime.microsecond)
+        toTime = time_in_microseconds(self.__toTime.hour, self.__toTime.minute, self.__toTime.second,
+                                      self.__toTime.microsecond)
+        ret &= (barTimes >= fromTime) & (barTimes <= toTime)
+        return ret
+
+
+def time_in_microseconds(hour, minute, second, microsecond):
+    return ((np.asarray(hour, dtype=np.int64) * 60 + minute) * 60 + second) * 1000000 + microsecond
+
 
 class BarFeed(membf.BarFeed):
     """Base class for CSV file based :class:`pyalgotrade.barfeed.BarFeed`.
@@ -179,7 +228,7 @@ class GenericRowParser(RowParser):
         # Process extra columns.
         extra = {}
         for k, v in csvRowDict.items():
-            if k not in self.__columnNames:
+            if k not in self.__columnNames.values():
                 extra[k] = csvutils.float_or_string(v)
 
         return self.__barClass(
@@ -266,14 +315,79 @@ class GenericBarFeed(BarFeed):
         if timezone is None:
             timezone = self.__timezone
 
-        rowParser = GenericRowParser(
-            self.__columnNames, self.__dateTimeFormat, self.getDailyBarTime(), self.getFrequency(),
-            timezone, self.__barClass
-        )
-
-        super(GenericBarFeed, self).addBarsFromCSV(instrument, path, rowParser)
-
-        if rowParser.barsHaveAdjClose():
+        barFilter = self.getBarFilter()
+        if barFilter is None or has_vectorised_filter(barFilter):
+            haveAdjClose = self.__addBarsFromCSVColumns(instrument, path, timezone, barFilter)
+        else:
+            rowParser = GenericRowParser(
+                self.__columnNames, self.__dateTimeFormat, self.getDailyBarTime(), self.getFrequency(),
+                timezone, self.__barClass
+            )
+            super(GenericBarFeed, self).addBarsFromCSV(instrument, path, rowParser)
+            haveAdjClose = rowParser.barsHaveAdjClose()
+
+        if haveAdjClose:
             self.__haveAdjClose = True
         elif self.__haveAdjClose:
             raise Exception("Previous bars had adjusted close and these ones don't have.")
+
+    # Same result as GenericRowParser plus the bar filter, but parsing, filtering and bar validation are done on whole
+    # columns and the bars are built when dispatched. Returns True if any row had an adjusted close.
+    def __addBarsFromCSVColumns(self, instrument, path, timezone, barFilter):
+        columnNames = self.__columnNames
+        adjCloseColName = columnNames["adj_close"]
+        # Like float(), empty values are only allowed in the adjusted close column.
+        df = pd.read_csv(
+            path, dtype={columnNames["datetime"]: str}, keep_default_na=False,
+            na_values={adjCloseColName: [""]} if adjCloseColName is not None else None, float_precision="round_trip"
+        )
+
+        dateTimes = pd.to_datetime(df[columnNames["datetime"]], format=self.__dateTimeFormat)
+        dailyBarTime = self.getDailyBarTime()
+        if dailyBarTime is not None:
+            dateTimes = dateTimes.dt.normalize() + pd.Timedelta(
+                hours=dailyBarTime.hour, minutes=dailyBarTime.minute, seconds=dailyBarTime.second,
+                microseconds=dailyBarTime.microsecond
+            )
+        dateTimes = pd.DatetimeIndex(dateTimes)
+        if timezone:
+            # As pytz localize does by default, ambiguous times are taken as standard time and non-existent ones get
+            # the standard time offset.
+            dateTimes = dateTimes.tz_localize(
+                timezone, ambiguous=np.zeros(len(dateTimes), dtype=bool), nonexistent=pd.Timedelta(hours=1)
+            )
+
+        adjClose = None
+        haveAdjClose = False
+        if adjCloseColName is not None and adjCloseColName in df.columns:
+            adjClose = df[adjCloseColName].to_numpy(dtype=float)
+            haveAdjClose = bool(np.any(~np.isnan(adjClose)))
+
+        if barFilter is not None:
+            mask = barFilter.includeBars(dateTimes)
+            df = df[mask]
+            dateTimes = dateTimes[mask]
+            if adjClose is not None:
+                adjClose = adjClose[mask]
+
+        extra = {}
+        for name in df.columns:
+            if name not in columnNames.values():
+                column = df[name]
+                if pd.api.types.is_numeric_dtype(column):
+                    extra[name] = column.astype(float).tolist()
+                else:
+                    extra[name] = [csvutils.float_or_string(value) for value in column.tolist()]
+
+        if dateTimes.tz is None:
+            dateTimes = dateTimes.to_numpy(dtype="datetime64[us]")
+        else:
+            dateTimes = dateTimes.to_pydatetime()
+
+        self.addBarsFromArrays(
+            instrument, dateTimes,
+            df[columnNames["open"]].to_numpy(dtype=float), df[columnNames["high"]].to_numpy(dtype=float),
+            df[columnNames["low"]].to_numpy(dtype=float), df[columnNames["close"]].to_numpy(dtype=float),
+            df[columnNames["volume"]].to_numpy(dtype=float), adjClose, extra, self.__barClass
+        )
+        return haveAdjClose
@@ -18,9 +18,180 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import datetime
+
+import numpy as np
+
 from pyalgotrade import barfeed
 from pyalgotrade import bar
-from pyalgotrade import utils
+from pyalgotrade.utils import dt
+
+MICROSECOND = datetime.timedelta(microseconds=1)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def timeline_keys(dateTimes):
+    """Returns int64 microseconds since the epoch for a sequence of datetimes, to sort bars on a single timeline.
+    Timezone aware datetimes are converted to UTC. datetime64 arrays are converted without creating datetime objects."""
+    if isinstance(dateTimes, np.ndarray) and dateTimes.dtype.kind == 'M':
+        return dateTimes.astype('datetime64[us]').view(np.int64)
+    # This is several times faster than np.array(dateTimes, dtype='datetime64[us]').
+    epoch = EPOCH
+    if len(dateTimes) and not dt.datetime_is_naive(dateTimes[0]):
+        epoch = dt.epoch_utc
+    return np.array([(dateTime - epoch) // MICROSECOND for dateTime in dateTimes], dtype=np.int64)
+
+
+# Bars added with addBarsFromSequence.
+class SequenceChunk(object):
+    def __init__(self, bars):
+        self.__bars = list(bars)
+
+    def __len__(self):
+        return len(self.__bars)
+
+    def getBars(self):
+        return self.__bars
+
+    def getDateTimes(self):
+        return [bar_.getDateTime() for bar_ in self.__bars]
+
+
+# Bars added with addBarsFromArrays. Bars are only built when they are dispatched.
+class ArraysChunk(object):
+    def __init__(self, dateTimes, open_, high, low, close, volume, adjClose, extra, barClass):
+        self.__isDateTime64 = isinstance(dateTimes, np.ndarray) and dateTimes.dtype.kind == 'M'
+        self.__dateTimes = dateTimes if self.__isDateTime64 else list(dateTimes)
+        self.__adjClose = None if adjClose is None else np.asarray(adjClose, dtype=float)
+        self.__extra = extra if extra else {}
+        self.__barClass = barClass
+
+        open_, high, low, close, volume = [np.asarray(column, dtype=float) for column in (open_, high, low, close, volume)]
+        for column in (open_, high, low, close, volume):
+            if len(column) != len(self.__dateTimes):
+                raise Exception("All columns must have the same length")
+        self.__check(high < low, "high < low")
+        self.__check(high < open_, "high < open")
+        self.__check(high < close, "high < close")
+        self.__check(low > open_, "low > open")
+        self.__check(low > close, "low > close")
+        # One row per bar, so that a single tolist() gets all the prices of a bar.
+        self.__values = np.column_stack((open_, high, low, close, volume))
+
+    # Same checks as BasicBar, done once for the whole arrays so that errors show up when loading.
+    def __check(self, invalid, what):
+        rows = np.flatnonzero(invalid)
+        if len(rows):
+            raise Exception("%s on %s" % (what, self.getDateTime(rows[0])))
+
+    def __len__(self):
+        return len(self.__dateTimes)
+
+    def getBars(self):
+        return None
+
+    def getDateTimes(self):
+        return self.__dateTimes
+
+    def getDateTime(self, row):
+        ret = self.__dateTimes[row]
+        if isinstance(ret, np.datetime64):
+            ret = ret.astype('datetime64[us]').item()
+        return ret
+
+    # dateTime is the datetime of the bars being dispatched. It is used for naive datetime64 values, which all
+    # convert to that same datetime, to save the conversion.
+    def getBar(self, row, frequency, dateTime):
+        if not self.__isDateTime64:
+            dateTime = self.__dateTimes[row]
+        open_, high, low, close, volume = self.__values[row].tolist()
+        adjClose = None
+        if self.__adjClose is not None:
+            adjClose = float(self.__adjClose[row])
+            if np.isnan(adjClose):
+                adjClose = None
+        extra = {name: values[row] for name, values in self.__extra.items()}
+        return self.__barClass(dateTime, open_, high, low, close, volume, adjClose, frequency, extra=extra)
+
+
+# Bars from all instruments are merged into a single timeline when the feed starts, sorted by datetime and then by
+# instrument, with the positions where the datetime changes precomputed. getNextBars only touches the bars it returns.
+class Timeline(object):
+    def __init__(self, chunks):
+        # chunks is a map of instrument to list of chunks.
+        instruments = list(chunks.keys())
+        allChunks = []
+        keys = []
+        instrumentIds = []
+        bars = []
+        lazy = []
+        chunkIds = []
+        rows = []
+        for instrumentId, instrument in enumerate(instruments):
+            for chunk in chunks[instrument]:
+                size = len(chunk)
+                keys.append(timeline_keys(chunk.getDateTimes()))
+                instrumentIds.append(np.full(size, instrumentId, dtype=np.int32))
+                chunkBars = np.empty(size, dtype=object)
+                if chunk.getBars() is not None:
+                    chunkBars[:] = chunk.getBars()
+                bars.append(chunkBars)
+                lazy.append(np.full(size, chunk.getBars() is None))
+                chunkIds.append(np.full(size, len(allChunks), dtype=np.int32))
+                rows.append(np.arange(size))
+                allChunks.append(chunk)
+
+        self.__chunks = allChunks
+        if not allChunks:
+            self.__groupStarts = [0]
+            return
+
+        keys = np.concatenate(keys)
+        instrumentIds = np.concatenate(instrumentIds)
+        order = np.lexsort((instrumentIds, keys))
+        keys = keys[order]
+        instrumentIds = instrumentIds[order]
+        self.__instruments = np.array(instruments, dtype=object)[instrumentIds]
+        # Bars added with addBarsFromSequence, and None where the bar has to be built from a chunk row.
+        self.__bars = np.concatenate(bars)[order]
+        self.__chunkIds = np.concatenate(chunkIds)[order]
+        self.__rows = np.concatenate(rows)[order]
+
+        groupStarts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)]))
+        self.__groupStarts = groupStarts.tolist()
+        # Groups with bars to build.
+        lazy = np.concatenate(([0], np.cumsum(np.concatenate(lazy)[order])))
+        self.__lazyGroups = set(np.flatnonzero(lazy[groupStarts[1:]] > lazy[groupStarts[:-1]]).tolist())
+        # Groups with more than one bar for the same instrument.
+        duplicates = np.flatnonzero((keys[1:] == keys[:-1]) & (instrumentIds[1:] == instrumentIds[:-1])) + 1
+        self.__duplicateGroups = set((np.searchsorted(groupStarts, duplicates, side="right") - 1).tolist())
+
+    def __len__(self):
+        return len(self.__groupStarts) - 1
+
+    def getDateTime(self, group):
+        begin = self.__groupStarts[group]
+        ret = self.__bars[begin]
+        if ret is None:
+            return self.__chunks[self.__chunkIds[begin]].getDateTime(self.__rows[begin])
+        return ret.getDateTime()
+
+    def getBars(self, group, frequency):
+        begin = self.__groupStarts[group]
+        end = self.__groupStarts[group + 1]
+        instruments = self.__instruments[begin:end].tolist()
+        if group in self.__duplicateGroups:
+            raise Exception("Duplicate bars found for %s on %s" % (instruments, self.getDateTime(group)))
+
+        bars = self.__bars[begin:end].tolist()
+        if group in self.__lazyGroups:
+            dateTime = self.getDateTime(group)
+            chunkIds = self.__chunkIds[begin:end].tolist()
+            rows = self.__rows[begin:end].tolist()
+            for i, bar_ in enumerate(bars):
+                if bar_ is None:
+                    bars[i] = self.__chunks[chunkIds[i]].getBar(rows[i], frequency, dateTime)
+        return dict(zip(instruments, bars))
 
 
 # A non real-time BarFeed responsible for:
@@ -34,15 +205,16 @@ class BarFeed(barfeed.BaseBarFeed):
     def __init__(self, frequency, maxLen=None):
         super(BarFeed, self).__init__(frequency, maxLen)
 
-        self.__bars = {}
-        self.__nextPos = {}
+        # instrument -> list of chunks.
+        self.__chunks = {}
         self.__started = False
         self.__currDateTime = None
+        # Built when the feed starts or when first needed.
+        self.__timeline = None
+        self.__nextGroup = 0
 
     def reset(self):
-        self.__nextPos = {}
-        for instrument in list(self.__bars.keys()):
-            self.__nextPos.setdefault(instrument, 0)
+        self.__nextGroup = 0
         self.__currDateTime = None
         super(BarFeed, self).reset()
 
@@ -52,6 +224,7 @@ class BarFeed(barfeed.BaseBarFeed):
     def start(self):
         super(BarFeed, self).start()
         self.__started = True
+        self.__getTimeline()
 
     def stop(self):
         pass
@@ -59,59 +232,56 @@ class BarFeed(barfeed.BaseBarFeed):
     def join(self):
         pass
 
-    def addBarsFromSequence(self, instrument, bars):
+    def __addChunk(self, instrument, chunk):
         if self.__started:
             raise Exception("Can't add more bars once you started consuming bars")
 
-        self.__bars.setdefault(instrument, [])
-        self.__nextPos.setdefault(instrument, 0)
-
-        # Add and sort the bars
-        self.__bars[instrument].extend(bars)
-        barCmp = lambda x, y: cmp(x.getDateTime(), y.getDateTime())
-        self.__bars[instrument].sort(barCmp)
+        self.__chunks.setdefault(instrument, []).append(chunk)
+        self.__timeline = None
 
         self.registerInstrument(instrument)
 
+    def addBarsFromSequence(self, instrument, bars):
+        self.__addChunk(instrument, SequenceChunk(bars))
+
+    def addBarsFromArrays(self, instrument, dateTimes, open_, high, low, close, volume, adjClose=None, extra=None,
+                          barClass=bar.BasicBar):
+        """Adds bars for an instrument from columns. The :class:`pyalgotrade.bar.Bar` objects are only built
+        when they are dispatched.
+
+        :param instrument: Instrument identifier.
+        :param dateTimes: A sequence of :class:`datetime.datetime`, or a datetime64 array for naive datetimes.
+        :param adjClose: The adjusted close values, or None. NaN values mean that the adjusted close is missing.
+        :param extra: A map of column name to values with the extra columns for the bars, or None.
+        :param barClass: The class used to build the bars.
+        """
+        self.__addChunk(instrument, ArraysChunk(dateTimes, open_, high, low, close, volume, adjClose, extra, barClass))
+
+    def __getTimeline(self):
+        if self.__timeline is None:
+            self.__timeline = Timeline(self.__chunks)
+        return self.__timeline
+
     def eof(self):
-        ret = True
-        # Check if there is at least one more bar to return.
-        for instrument, bars in self.__bars.items():
-            nextPos = self.__nextPos[instrument]
-            if nextPos < len(bars):
-                ret = False
-                break
-        return ret
+        return self.__nextGroup >= len(self.__getTimeline())
 
     def peekDateTime(self):
         ret = None
-
-        for instrument, bars in self.__bars.items():
-            nextPos = self.__nextPos[instrument]
-            if nextPos < len(bars):
-                ret = utils.safe_min(ret, bars[nextPos].getDateTime())
+        timeline = self.__getTimeline()
+        if self.__nextGroup < len(timeline):
+            ret = timeline.getDateTime(self.__nextGroup)
         return ret
 
     def getNextBars(self):
-        # All bars must have the same datetime. We will return all the ones with the smallest datetime.
-        smallestDateTime = self.peekDateTime()
-
-        if smallestDateTime is None:
+        timeline = self.__getTimeline()
+        if self.__nextGroup >= len(timeline):
             return None
 
-        # Make a second pass to get all the bars that had the smallest datetime.
-        ret = {}
-        for instrument, bars in self.__bars.items():
-            nextPos = self.__nextPos[instrument]
-            if nextPos < len(bars) and bars[nextPos].getDateTime() == smallestDateTime:
-                ret[instrument] = bars[nextPos]
-                self.__nextPos[instrument] += 1
-
-        if self.__currDateTime == smallestDateTime:
-            raise Exception("Duplicate bars found for %s on %s" % (list(ret.keys()), smallestDateTime))
-
-        self.__currDateTime = smallestDateTime
-        return bar.Bars(ret)
+        # All bars in the group have the same datetime.
+        ret = bar.Bars(timeline.getBars(self.__nextGroup, self.getFrequency()))
+        self.__nextGroup += 1
+        self.__currDateTime = ret.getDateTime()
+        return ret
 
     def loadAll(self):
         for dateTime, bars in self:
@@ -25,6 +25,7 @@ import queue
 from pyalgotrade import bar
 from pyalgotrade import barfeed
 from pyalgotrade import observer
+from pyalgotrade import asyncdispatcher
 from pyalgotrade.bitstamp import common
 from pyalgotrade.bitstamp import wsclient
 
@@ -118,6 +119,8 @@ class LiveTradeFeed(barfeed.BaseBarFeed):
         self.__enableReconnection = True
         self.__stopped = False
         self.__orderBookUpdateEvent = observer.Event()
+        # An event taken from the queue by nextEvent.
+        self.__pendingEvent = None
 
     # Factory method for testing purposes.
     def buildWebSocketClientThread(self):
@@ -168,7 +171,11 @@ class LiveTradeFeed(barfeed.BaseBarFeed):
     def __dispatchImpl(self, eventFilter):
         ret = False
         try:
-            eventType, eventData = self.__thread.getQueue().get(True, LiveTradeFeed.QUEUE_TIMEOUT)
+            if self.__pendingEvent is not None:
+                eventType, eventData = self.__pendingEvent
+                self.__pendingEvent = None
+            else:
+                eventType, eventData = self.__thread.getQueue().get(True, LiveTradeFeed.QUEUE_TIMEOUT)
             if eventFilter is not None and eventType not in eventFilter:
                 return False
 
@@ -225,6 +232,11 @@ class LiveTradeFeed(barfeed.BaseBarFeed):
             self.__stopped = True
             raise Exception("Initialization failed")
 
+    async def nextEvent(self):
+        # Used by asyncdispatcher.AsyncDispatcher. The event taken from the queue is handled by the next dispatch.
+        if not len(self.__barDicts) and self.__pendingEvent is None:
+            self.__pendingEvent = await asyncdispatcher.get_from_queue(self.__thread.getQueue(), self.eof)
+
     def dispatch(self):
         # Note that we may return True even if we didn't dispatch any Bar
         # event.
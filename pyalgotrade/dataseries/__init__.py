@@ -145,11 +145,15 @@ class SequenceDataSeries(DataSeries):
 
 
 class BufferedSequenceDataSeries:
-    def __init__(self):
+    def __init__(self, values=None, dateTimes=None):
+        # values and dateTimes are the containers to use. Python lists by default.
         self.__newValueEvent = observer.Event()
+        self.__newValuesEvent = observer.Event()
         self.__updateValueEvent = observer.Event()
-        self.__values = collections.BufferedList()
-        self.__dateTimes = collections.BufferedList()
+        self.__values = collections.BufferedList() if values is None else values
+        self.__dateTimes = collections.BufferedList() if dateTimes is None else dateTimes
+        self.__historyRequirement = 0
+        self.__historyPager = None
 
     def __len__(self):
         return len(self.__values)
@@ -158,12 +162,34 @@ class BufferedSequenceDataSeries:
         return iter(self.__values)
 
     def __getitem__(self, item):
+        if self.__historyPager is not None:
+            self.__pageHistory(item)
         return self.__values[item]
 
+    def __pageHistory(self, item):
+        # Only negative positions, which are relative to the last value, reach past the loaded values.
+        if isinstance(item, int):
+            reach = -item
+        elif isinstance(item, slice) and item.start is not None and (item.step is None or item.step > 0):
+            reach = -item.start
+        else:
+            return
+        # An empty series has nothing to page back from.
+        while len(self) and reach > len(self) and self.__historyPager is not None:
+            self.__historyPager(reach - len(self))
+
     @property
     def newValueEvent(self):
         return self.__newValueEvent
 
+    # Event handler receives:
+    # 1: Dataseries generating the event
+    # 2: The datetimes for the new values
+    # 3: The new values
+    @property
+    def newValuesEvent(self):
+        return self.__newValuesEvent
+
     @property
     def updateValueEvent(self):
         return self.__updateValueEvent
@@ -175,6 +201,34 @@ class BufferedSequenceDataSeries:
     def isBuffering(self):
         return self.__values.isBuffering() or self.__dateTimes.isBuffering()
 
+    @property
+    def historyRequirement(self):
+        """Returns the number of values the subscribed filters need before producing their first value."""
+        return self.__historyRequirement
+
+    def requireHistory(self, size):
+        """Called by filters built on top of this series to declare how many values they need."""
+        self.__historyRequirement = max(self.__historyRequirement, size)
+
+    def setHistoryPager(self, pager):
+        """Sets a pager(count) that is called when a negative index or slice start reaches past the first value.
+        It should prepend at least count older values, or call setHistoryPager(None) if there are no more."""
+        self.__historyPager = pager
+
+    def prepend(self, dateTimes, values):
+        """Inserts older values at the beginning without emitting any event.
+
+        .. note::
+            dateTimes must be sorted and older than the first datetime in the series.
+        """
+        assert len(dateTimes) == len(values)
+        if len(dateTimes) == 0:
+            return
+        if self.__dateTimes and dateTimes[-1] >= self.__dateTimes[0]:
+            raise Exception("Invalid datetime. It %s must be less than the first one %s" % (dateTimes[-1], self.__dateTimes[0]))
+        self.__dateTimes.prepend(dateTimes)
+        self.__values.prepend(values)
+
     def append(self, dateTime,value):
         """Appends a value."""
         assert dateTime is not None
@@ -190,14 +244,62 @@ class BufferedSequenceDataSeries:
         self.__values.append(value)
         self.__newValueEvent.emit(self, dateTime, value)
 
+    def extend(self, dateTimes, values):
+        """Appends many values at once and emits a single newValuesEvent instead of one newValueEvent per value.
+
+        .. note::
+            dateTimes must be sorted and bigger than the last one. The series can not be buffering.
+        """
+        assert len(dateTimes) == len(values)
+        if len(dateTimes) == 0:
+            return
+        if self.isBuffering():
+            raise Exception("Can not extend while buffering %s" % (self.__dateTimes[-1]))
+        if self.__dateTimes and self.__dateTimes[-1] >= dateTimes[0]:
+            raise Exception("Invalid datetime. It %s must be bigger than that last one %s" % (dateTimes[0], self.__dateTimes[-1]))
+        self.__dateTimes.extend(dateTimes)
+        self.__values.extend(values)
+        self.__newValuesEvent.emit(self, dateTimes, values)
+
     def update(self,dateTime,value):
         assert dateTime is not None
         #技术指标可以为None
         #assert value is not None
-        if self.__dateTimes and self.__dateTimes[-1] != dateTime:
-            raise Exception("Invalid datetime. It %s must be bigger than that last one %s" % (self.__dateTimes[-1],dateTime))
+        if self.__dateTimes:
+            #缓存中的值只能用相同时间更新，已提交的值之后只能开始新的时间
+            if self.isBuffering() and self.__dateTimes[-1] != dateTime:
+                raise Exception("Invalid datetime. It %s must be equal to the buffering one %s" % (dateTime,self.__dateTimes[-1]))
+            if not self.isBuffering() and self.__dateTimes[-1] >= dateTime:
+                raise Exception("Invalid datetime. It %s must be bigger than that last one %s" % (dateTime,self.__dateTimes[-1]))
         self.__dateTimes.update(dateTime)
         self.__values.update(value)
         self.__updateValueEvent.emit(self,dateTime,value)
 
 
+class BufferedNumPySequenceDataSeries(BufferedSequenceDataSeries):
+    """A columnar BufferedSequenceDataSeries that keeps float64 values and datetime64[s] datetimes in growable numpy
+    arrays instead of lists of Python objects.
+
+    .. note::
+        * None values are stored as NaN.
+        * Slices are numpy views. Use :meth:`asarray` to get all the values without copying.
+    """
+
+    def __init__(self):
+        self.__values = collections.BufferedNumPyList(float)
+        self.__dateTimes = collections.BufferedDateTimeList()
+        super().__init__(self.__values, self.__dateTimes)
+
+    def asarray(self):
+        """Returns a read-only view of the values. The view is not updated when the series grows."""
+        ret = self.__values.data()
+        ret.flags.writeable = False
+        return ret
+
+    def dateTimesAsArray(self):
+        """Returns a read-only datetime64[s] view of the datetimes."""
+        ret = self.__dateTimes.asarray()
+        ret.flags.writeable = False
+        return ret
+
+
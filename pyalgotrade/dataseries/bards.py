@@ -113,16 +113,60 @@ class BarDataSeries(dataseries.SequenceDataSeries):
 class BufferedBarDataSeries(dataseries.BufferedSequenceDataSeries):
     '''
     带缓存功能的Bar序列
+    设置了历史数据载入函数后，Bar序列或开高低收量子序列的负索引、负起点切片超出已载入的范围时，
+    会自动向前翻页载入更早的Bar，所有序列同时翻页，保持长度一致
     '''
-    def __init__(self,zipMode=True):
+    #向前翻页时最少载入的Bar数量
+    HISTORY_PAGE_SIZE = 250
+
+    def __init__(self,zipMode=True,columnar=False):
+        '''
+        :param columnar: 为True时开高低收量子序列使用numpy数组存储，见BufferedNumPySequenceDataSeries
+            取出的值为np.float64，None变为NaN，日期时间变为不带时区、精确到秒的datetime64，默认关闭
+        '''
         super().__init__()
         self.__zipMode = zipMode
+        seriesClass = dataseries.BufferedNumPySequenceDataSeries if columnar else dataseries.BufferedSequenceDataSeries
         if not zipMode:
-            self.__openDS = dataseries.BufferedSequenceDataSeries()
-            self.__highDS = dataseries.BufferedSequenceDataSeries()
-            self.__lowDS = dataseries.BufferedSequenceDataSeries()
-        self.__closeDS = dataseries.BufferedSequenceDataSeries()
-        self.__volumeDS = dataseries.BufferedSequenceDataSeries()
+            self.__openDS = seriesClass()
+            self.__highDS = seriesClass()
+            self.__lowDS = seriesClass()
+        self.__closeDS = seriesClass()
+        self.__volumeDS = seriesClass()
+        self.__historyLoader = None
+
+    def __childSeries(self):
+        if self.__zipMode:
+            return (self.__closeDS, self.__volumeDS)
+        return (self.__openDS, self.__highDS, self.__lowDS, self.__closeDS, self.__volumeDS)
+
+    @property
+    def historyRequirement(self):
+        return max([super().historyRequirement] + [ds.historyRequirement for ds in self.__childSeries()])
+
+    def setHistoryLoader(self, loader):
+        '''
+        :param loader: loader(dateTime, count)，返回dateTime之前最多count个Bar的列表，按时间升序，没有更多数据时返回空列表
+        '''
+        self.__historyLoader = loader
+        pager = None if loader is None else self.__loadHistory
+        for ds in (self,) + self.__childSeries():
+            ds.setHistoryPager(pager)
+
+    def __loadHistory(self, count):
+        bars = self.__historyLoader(self.dateTimes[0], max(count, BufferedBarDataSeries.HISTORY_PAGE_SIZE))
+        if len(bars) == 0:
+            #已经没有更早的数据了
+            self.setHistoryLoader(None)
+            return
+        dateTimes = [bar.dateTime for bar in bars]
+        self.prepend(dateTimes, bars)
+        if not self.__zipMode:
+            self.__openDS.prepend(dateTimes, [bar.open for bar in bars])
+            self.__highDS.prepend(dateTimes, [bar.high for bar in bars])
+            self.__lowDS.prepend(dateTimes, [bar.low for bar in bars])
+        self.__closeDS.prepend(dateTimes, [bar.close for bar in bars])
+        self.__volumeDS.prepend(dateTimes, [bar.volume for bar in bars])
 
     def append(self, dateTime, bar):
 
@@ -138,6 +182,18 @@ class BufferedBarDataSeries(dataseries.BufferedSequenceDataSeries):
         self.__closeDS.append(dateTime, bar.close)
         self.__volumeDS.append(dateTime, bar.volume)
 
+    def extend(self, dateTimes, bars):
+        '''
+        一次追加多个Bar，每个子序列只触发一次newValuesEvent，用于载入历史数据
+        '''
+        super().extend(dateTimes, bars)
+        if not self.__zipMode:
+            self.__openDS.extend(dateTimes, [bar.open for bar in bars])
+            self.__highDS.extend(dateTimes, [bar.high for bar in bars])
+            self.__lowDS.extend(dateTimes, [bar.low for bar in bars])
+        self.__closeDS.extend(dateTimes, [bar.close for bar in bars])
+        self.__volumeDS.extend(dateTimes, [bar.volume for bar in bars])
+
     def update(self,dateTime,bar):
 
         assert(dateTime is not None)
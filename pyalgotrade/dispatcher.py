@@ -18,19 +18,34 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import bisect
+import heapq
+
 from pyalgotrade import utils
 from pyalgotrade import observer
 from pyalgotrade import dispatchprio
 
 
 # This class is responsible for dispatching events from multiple subjects, synchronizing them if necessary.
+# By default every subject is checked on every event. With useHeap, subjects that know the datetime of their next event
+# are kept in a heap keyed by that datetime, so only the ones being dispatched are checked and re-keyed. Subjects that
+# return None from peekDateTime (realtime subjects, the broker, resampled feeds) are still checked on every event.
+# This assumes that the next datetime of a subject in the heap only changes when that subject dispatches, which is the
+# case for historical feeds. A stale key is detected when it gets to the top of the heap and fixed there.
 class Dispatcher(object):
-    def __init__(self):
+    def __init__(self, useHeap=False):
         self.__subjects = []
         self.__stop = False
         self.__startEvent = observer.Event()
         self.__idleEvent = observer.Event()
         self.__currDateTime = None
+        self.__useHeap = useHeap
+        # Built when dispatching starts and every time a subject is added.
+        self.__heap = None
+        self.__realtime = None
+        self.__order = {}
+        # Subjects that left the heap at eof.
+        self.__finished = set()
 
     # Returns the current event datetime. It may be None for events from realtime subjects.
     def getCurrentDateTime(self):
@@ -48,6 +63,10 @@ class Dispatcher(object):
     def getSubjects(self):
         return self.__subjects
 
+    def setUseHeap(self, useHeap):
+        """Sets whether subjects with a known next datetime are scheduled using a heap. Must be set before running."""
+        self.__useHeap = useHeap
+
     def addSubject(self, subject):
         # Skip the subject if it was already added.
         if subject in self.__subjects:
@@ -65,6 +84,10 @@ class Dispatcher(object):
                 pos += 1
             self.__subjects.insert(pos, subject)
 
+        # Positions changed, so the schedule has to be rebuilt.
+        self.__order = {s: i for i, s in enumerate(self.__subjects)}
+        self.__heap = None
+
         subject.onDispatcherRegistered(self)
 
     # Return True if events were dispatched.
@@ -98,6 +121,78 @@ class Dispatcher(object):
                     eventsDispatched = True
         return eof, eventsDispatched
 
+    def __schedule(self):
+        self.__heap = []
+        self.__realtime = []
+        for subject in self.__subjects:
+            if subject in self.__finished:
+                continue
+            dateTime = subject.peekDateTime()
+            if dateTime is None:
+                # Realtime subjects may be at eof until other subjects give them events, like resampled feeds.
+                self.__addRealtime(subject)
+            elif not subject.eof():
+                heapq.heappush(self.__heap, (dateTime, self.__order[subject], subject))
+
+    def __addRealtime(self, subject):
+        # Entries are (position, subject) so that the list stays in priority order.
+        bisect.insort(self.__realtime, (self.__order[subject], subject))
+
+    # Re-keys a subject that was in the heap.
+    def __scheduleSubject(self, subject):
+        if subject.eof():
+            # Historical subjects that hit eof are not scheduled again.
+            self.__finished.add(subject)
+            return
+        dateTime = subject.peekDateTime()
+        if dateTime is None:
+            self.__addRealtime(subject)
+        else:
+            heapq.heappush(self.__heap, (dateTime, self.__order[subject], subject))
+
+    # Returns the datetime at the top of the heap, after fixing the entries with a stale key.
+    def __peekHeap(self):
+        heap = self.__heap
+        while heap:
+            dateTime, _, subject = heap[0]
+            if not subject.eof() and subject.peekDateTime() == dateTime:
+                return dateTime
+            heapq.heappop(heap)
+            self.__scheduleSubject(subject)
+        return None
+
+    # Same as __dispatch but only checks the realtime subjects and the ones at the top of the heap.
+    def __dispatchScheduled(self):
+        if self.__heap is None:
+            self.__schedule()
+
+        smallestDateTime = self.__peekHeap()
+        eof = smallestDateTime is None
+        eventsDispatched = False
+
+        for _, subject in self.__realtime:
+            if not subject.eof():
+                eof = False
+                smallestDateTime = utils.safe_min(smallestDateTime, subject.peekDateTime())
+
+        if not eof:
+            self.__currDateTime = smallestDateTime
+
+            due = []
+            while smallestDateTime is not None and self.__peekHeap() == smallestDateTime:
+                due.append(heapq.heappop(self.__heap)[1:])
+
+            # Dispatch in priority order. Realtime subjects are checked when their turn comes, as in __dispatch, since
+            # subjects dispatched before them may have generated their events.
+            for _, subject in heapq.merge(due, list(self.__realtime)):
+                if self.__dispatchSubject(subject, smallestDateTime):
+                    eventsDispatched = True
+
+            # Re-key only the subjects that were due.
+            for _, subject in due:
+                self.__scheduleSubject(subject)
+        return eof, eventsDispatched
+
     def run(self):
         try:
             for subject in self.__subjects:
@@ -105,8 +200,11 @@ class Dispatcher(object):
 
             self.__startEvent.emit()
 
+            dispatch = self.__dispatchScheduled if self.__useHeap else self.__dispatch
+            self.__heap = None
+            self.__finished = set()
             while not self.__stop:
-                eof, eventsDispatched = self.__dispatch()
+                eof, eventsDispatched = dispatch()
                 if eof:
                     self.__stop = True
                 elif not eventsDispatched:
@@ -19,10 +19,15 @@
 """
 
 import abc
+import asyncio
+import concurrent.futures
 
+import pyalgotrade.logger
 from pyalgotrade import observer
 from pyalgotrade import dataseries
 
+logger = pyalgotrade.logger.getLogger("feed")
+
 def feed_iterator(feed):
     feed.start()
     try:
@@ -120,17 +125,36 @@ class BaseFeed(observer.Subject):
 
 
 class BaseLiveFeed(observer.Subject):
-    def __init__(self):
+    '''
+    实时数据源，每次dispatch时在线程池中并发获取所有股票所有周期的数据，
+    并在dispatch线程中按响应到达的先后顺序更新股票和发出事件
+    :param maxWorkers: 并发请求的上限
+    '''
+    def __init__(self, maxWorkers=8):
         super().__init__()
         self.__stop = True
         self.__stocks = {}
         self.__event = observer.Event()
+        self.__maxWorkers = maxWorkers
+        self.__executor = None
+        #nextEvent预先获取的数据，list of (code, frequency, data)
+        self.__prefetched = None
+        #nextEvent进行中的一轮数据获取，每个响应到达后放入队列，一轮结束时放入None
+        self.__responses = None
 
     def start(self):
         self.__stop = False
 
+    def __getExecutor(self):
+        if self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.__maxWorkers)
+        return self.__executor
+
     def stop(self):
         self.__stop = True
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
 
     def eof(self):
         return self.__stop
@@ -144,29 +168,121 @@ class BaseLiveFeed(observer.Subject):
     def getNewValuesEvent(self):
         return self.__event
 
+    def __fetch(self):
+        '''
+        并发获取所有股票所有周期的数据，按响应到达的先后顺序返回(code, frequency, data)
+        '''
+        self.beforeDispatch()
+        executor = self.__getExecutor()
+        futures = {}
+        for code in self.__stocks:
+            for frequency in self.__stocks[code].livePeriods:
+                futures[executor.submit(self.fetchBarData, code, frequency)] = (code, frequency)
+        #先返回的先处理，不等待最慢的请求
+        for future in concurrent.futures.as_completed(futures):
+            code, frequency = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                logger.error('failed to fetch %s %s: %s' % (code, frequency, e))
+                continue
+            yield code, frequency, data
+
+    async def nextEvent(self):
+        '''
+        供asyncdispatcher使用，一轮数据获取在线程中进行，不阻塞事件循环
+        有响应到达即返回，之后的dispatch处理已经到达的响应，不等待最慢的请求
+        '''
+        if self.__prefetched is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if self.__responses is None:
+            self.__responses = asyncio.Queue()
+            loop.run_in_executor(None, self.__streamFetch, loop, self.__responses)
+        responses = self.__responses
+        prefetched = []
+        item = await responses.get()
+        while True:
+            if item is None or isinstance(item, Exception):
+                #本轮结束，下次nextEvent开始新的一轮
+                self.__responses = None
+                if item is not None:
+                    raise item
+                break
+            prefetched.append(item)
+            if responses.empty():
+                break
+            item = responses.get_nowait()
+        self.__prefetched = prefetched
+
+    def __streamFetch(self, loop, responses):
+        '''
+        在线程中执行一轮数据获取，响应到达后交给事件循环，获取出错时把异常交给nextEvent抛出
+        '''
+        end = None
+        try:
+            for item in self.__fetch():
+                if self.__stop:
+                    break
+                loop.call_soon_threadsafe(responses.put_nowait, item)
+        except Exception as e:
+            end = e
+        try:
+            loop.call_soon_threadsafe(responses.put_nowait, end)
+        except RuntimeError:
+            #事件循环已经关闭
+            pass
+
     def dispatch(self):
         ret = False
-        for code in self.__stocks:
+        if self.__prefetched is not None:
+            fetched = self.__prefetched
+            self.__prefetched = None
+        else:
+            fetched = self.__fetch()
+        for code, frequency, data in fetched:
             stock = self.__stocks[code]
-            for frequency in stock.analysisPeriods:
-                bar,update= self.getNextBar(code,frequency)
-                if bar is not None:
-                    ret = True
-                    if update:
-                        stock.update(bar)
-                    else:
-                        stock.append(bar)
-                    self.__event.emit(bar.dateTime,bar)
+            #与获取失败一样，单只股票的数据出错只记录日志并跳过，不能中断整个feed
+            try:
+                bar,update= self.getNextBar(code,frequency,data)
+            except Exception as e:
+                logger.error('failed to process %s %s: %s' % (code, frequency, e))
+                continue
+            if bar is not None:
+                ret = True
+                if update:
+                    stock.update(bar)
+                else:
+                    stock.append(bar)
+                self.__event.emit(bar.dateTime,bar)
         return ret
 
     def __getitem__(self, code):
         return self.__stocks[code]
 
-    def getNextBar(self,code,frequency):
+    @property
+    def codes(self):
+        return list(self.__stocks.keys())
+
+    def beforeDispatch(self):
+        '''
+        每次dispatch开始时调用一次，子类可以在这里批量获取所有股票的数据，供之后的getNextBar使用
+        '''
+        pass
+
+    def fetchBarData(self,code,frequency):
+        '''
+        在线程池中执行，获取股票某个周期的原始数据，只应做网络请求，不能修改股票
+        :return:交给getNextBar的数据
+        '''
+        return None
+
+    def getNextBar(self,code,frequency,data):
         '''
-        获取股票某个周期下的下一个Bar
+        在dispatch线程中执行，根据fetchBarData返回的数据得到股票某个周期下的下一个Bar
         :param code:
         :param frequency:
+        :param data:fetchBarData的返回值
         :return:返回一个tuple，True表示update bar，False表示new bar
         '''
         raise NotImplementedError()
@@ -24,44 +24,24 @@ from pyalgotrade import dispatchprio
 
 
 class Event(object):
+    # emit iterates over an immutable tuple of handlers that is rebuilt on subscribe/unsubscribe.
+    # Changes made while emitting don't affect the emit in progress, since it keeps iterating over the previous tuple.
     def __init__(self):
         self.__handlers = []
-        self.__toSubscribe = []
-        self.__toUnsubscribe = []
-        self.__emitting = False
-
-    def __applyChanges(self):
-        if len(self.__toSubscribe):
-            for handler in self.__toSubscribe:
-                if handler not in self.__handlers:
-                    self.__handlers.append(handler)
-            self.__toSubscribe = []
-
-        if len(self.__toUnsubscribe):
-            for handler in self.__toUnsubscribe:
-                self.__handlers.remove(handler)
-            self.__toUnsubscribe = []
+        self.__emitHandlers = ()
 
     def subscribe(self, handler):
-        if self.__emitting:
-            self.__toSubscribe.append(handler)
-        elif handler not in self.__handlers:
+        if handler not in self.__handlers:
             self.__handlers.append(handler)
+            self.__emitHandlers = tuple(self.__handlers)
 
     def unsubscribe(self, handler):
-        if self.__emitting:
-            self.__toUnsubscribe.append(handler)
-        else:
-            self.__handlers.remove(handler)
+        self.__handlers.remove(handler)
+        self.__emitHandlers = tuple(self.__handlers)
 
     def emit(self, *args, **kwargs):
-        try:
-            self.__emitting = True
-            for handler in self.__handlers:
-                handler(*args, **kwargs)
-        finally:
-            self.__emitting = False
-            self.__applyChanges()
+        for handler in self.__emitHandlers:
+            handler(*args, **kwargs)
 
 
 class Subject(object, metaclass=abc.ABCMeta):
@@ -1,92 +1,275 @@
 from pyalgotrade.dataseries.bards import BufferedBarDataSeries
 from pyalgotrade.stock import wangyi,sina
 from pyalgotrade.stock.bar import Bar,Frequency
+import pyalgotrade.logger
+import numpy as np
+import concurrent.futures
 import datetime
+import functools
 import os
 import sqlite3
+import threading
+
+
+logger = pyalgotrade.logger.getLogger("stock")
+
+#前收盘与上一交易日收盘价相差超过该值时认为发生了除权除息
+EX_RIGHTS_THRESHOLD = 0.005
+
+
+def computeAdjustFactors(dates, closes, lastCloses, prevClose=np.nan, prevFactor=1.0):
+    '''
+    根据收盘价和网易提供的前收盘价找出除权除息日，计算累积复权因子
+    除权日的因子为上一交易日收盘价/除权日前收盘价，累积因子是上市以来所有因子的乘积
+    :param dates: 按日期升序排列的有效交易日
+    :param closes: 收盘价
+    :param lastCloses: 前收盘价
+    :param prevClose: dates之前最后一个交易日的收盘价，没有时为nan
+    :param prevFactor: dates之前最后一个除权日的累积因子
+    :return: (除权日, 累积因子)
+    '''
+    dates = np.asarray(dates)
+    closes = np.asarray(closes, dtype=float)
+    lastCloses = np.asarray(lastCloses, dtype=float)
+    prevCloses = np.concatenate(([prevClose], closes[:-1]))
+    with np.errstate(invalid='ignore'):
+        mask = (lastCloses > 0) & (prevCloses > 0) & (np.abs(lastCloses - prevCloses) > EX_RIGHTS_THRESHOLD)
+    return dates[mask], prevFactor * np.cumprod(prevCloses[mask] / lastCloses[mask])
+
+
+def forwardAdjust(dates, prices, factorDates, factors):
+    '''
+    前复权，以最新的价格为基准，每个交易日的价格乘以 该日累积因子/最新累积因子
+    :param dates: 交易日，升序
+    :param prices: 二维数组，每行对应一个交易日，就地修改
+    :param factorDates: 除权日，升序
+    :param factors: 累积因子
+    '''
+    if len(factors) == 0:
+        return prices
+    #每个交易日对应的是该日及之前最后一个除权日的累积因子
+    cumulative = np.concatenate(([1.0], factors))
+    scale = cumulative[np.searchsorted(factorDates, dates, side='right')] / factors[-1]
+    prices *= scale[:, np.newaxis]
+    return prices
 
 
 
 class DBInterface:
     '''
     网易数据源日线数据库接口
-    每个股票对应一张表，表名是股票的代码
-    数据库数据按日期升序排列，使用前复权
+    所有股票的日线数据存放在同一张表DAY_BARS中，以(CODE, DATE)为主键
+    DAY_BARS是WITHOUT ROWID表，主键本身即是按(CODE, DATE)聚簇的覆盖索引，按股票按日期的区间查询只需一次索引扫描
+    DAY_BARS_META记录每只股票的最新日期、行数和最近同步时间，与数据在同一个事务中更新
+    每个线程对每个数据库文件保持一个长连接，使用WAL日志，close只关闭当前线程的连接
+    DAY_BARS只保存网易的除权数据，ADJ_FACTORS记录每个除权日的累积复权因子，写入新数据时在同一个事务中追加
+    载入时按复权因子计算前复权价格，发生除权时不需要重新下载历史数据
     '''
+    #一次IN查询的股票数量，不超过SQLite的参数个数限制
+    QUERY_BATCH_SIZE = 500
+    INSERT_SQL = "INSERT OR REPLACE INTO DAY_BARS(STATUS,DATE,CODE,NAME,TCLOSE,HIGH,LOW,TOPEN,LCLOSE,CHG,PCHG," \
+                 "TURNOVER,VOTURNOVER,VATURNOVER,TCAP,MCAP) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+    #已经建好表结构的数据库文件，同一进程内每个数据库只检查一次
+    __initializedPaths = set()
+    EMPTY_DATE = '1989-12-31'
+    #数据库文件->DAY_BARS_META中已有的股票代码，建表时失效，插入数据时更新
+    __codes = {}
+    __lock = threading.Lock()
+    __local = threading.local()
+
     def __init__(self):
         self.__path = os.path.join(os.path.join(os.getcwd(),'datasource\\wangyi'),'day.db')
-        self.__conn = None
-
-    def __get_tables(self):
-        with sqlite3.connect(self.__path) as conn:
-            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            return [row[0] for row in cursor]
-
-    def __has_table(self, code):
-        return code in self.__get_tables()
-
-    def __create_table(self, code):
-        if not self.__has_table(code):
-            with sqlite3.connect(self.__path) as conn:
-                conn.execute('CREATE TABLE "{0}"('
-                      'STATUS INTEGER NOT NULL,'
-                      'DATE TEXT PRIMARY KEY NOT NULL,'
-                      'CODE TEXT NOT NULL,'
-                      'NAME TEXT NOT NULL,'
-                      'TCLOSE REAL, '
-                      'HIGH REAL,'
-                      'LOW REAL,'
-                      'TOPEN REAL,'
-                      'LCLOSE REAL,'
-                      'CHG REAL,'
-                      'PCHG REAL,'
-                      'TURNOVER REAL,'
-                      'VOTURNOVER REAL,'
-                      'VATURNOVER REAL,'
-                      'TCAP REAL,'
-                      'MCAP REAL);'.format(code))
-                conn.commit()
-
-    def __inset_without_commit(self, code, *args):
-        if len(args) == 0:
+
+    def __connection(self):
+        conns = getattr(DBInterface.__local, 'conns', None)
+        if conns is None:
+            conns = DBInterface.__local.conns = {}
+        conn = conns.get(self.__path)
+        if conn is None:
+            conn = sqlite3.connect(self.__path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conns[self.__path] = conn
+            self.__ensureSchema(conn)
+        return conn
+
+    def close(self):
+        '''
+        关闭当前线程的数据库连接
+        '''
+        conns = getattr(DBInterface.__local, 'conns', {})
+        conn = conns.pop(self.__path, None)
+        if conn is not None:
+            conn.close()
+
+    def __ensureSchema(self, conn):
+        with DBInterface.__lock:
+            if self.__path in DBInterface.__initializedPaths:
+                return
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS DAY_BARS('
+                             'STATUS INTEGER NOT NULL,'
+                             'DATE TEXT NOT NULL,'
+                             'CODE TEXT NOT NULL,'
+                             'NAME TEXT NOT NULL,'
+                             'TCLOSE REAL, '
+                             'HIGH REAL,'
+                             'LOW REAL,'
+                             'TOPEN REAL,'
+                             'LCLOSE REAL,'
+                             'CHG REAL,'
+                             'PCHG REAL,'
+                             'TURNOVER REAL,'
+                             'VOTURNOVER REAL,'
+                             'VATURNOVER REAL,'
+                             'TCAP REAL,'
+                             'MCAP REAL,'
+                             'PRIMARY KEY(CODE, DATE)) WITHOUT ROWID;')
+                hasMeta = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='DAY_BARS_META'").fetchone()
+                conn.execute('CREATE TABLE IF NOT EXISTS DAY_BARS_META('
+                             'CODE TEXT PRIMARY KEY NOT NULL,'
+                             'LATEST_DATE TEXT NOT NULL,'
+                             'ROW_COUNT INTEGER NOT NULL,'
+                             'LAST_SYNC TEXT);')
+                if hasMeta is None:
+                    #旧数据库没有索引表，从现有数据重建一次
+                    DBInterface.__rebuildMeta(conn)
+                hasFactors = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ADJ_FACTORS'").fetchone()
+                conn.execute('CREATE TABLE IF NOT EXISTS ADJ_FACTORS('
+                             'CODE TEXT NOT NULL,'
+                             'DATE TEXT NOT NULL,'
+                             'FACTOR REAL NOT NULL,'
+                             'PRIMARY KEY(CODE, DATE)) WITHOUT ROWID;')
+                if hasFactors is None:
+                    #旧数据库没有复权因子，从现有数据计算一次
+                    for row in conn.execute('SELECT CODE FROM DAY_BARS_META').fetchall():
+                        DBInterface.__rebuildFactors(conn, row[0])
+            DBInterface.__codes.pop(self.__path, None)
+            DBInterface.__initializedPaths.add(self.__path)
+
+    @staticmethod
+    def __rebuildMeta(conn):
+        conn.execute('INSERT OR REPLACE INTO DAY_BARS_META(CODE,LATEST_DATE,ROW_COUNT,LAST_SYNC) '
+                     'SELECT CODE,MAX(DATE),COUNT(*),NULL FROM DAY_BARS GROUP BY CODE')
+
+    @staticmethod
+    def __rebuildFactors(conn, code):
+        rows = conn.execute("SELECT DATE,TCLOSE,LCLOSE FROM DAY_BARS WHERE CODE=? AND STATUS=0 ORDER BY DATE ASC",
+                            (code,)).fetchall()
+        conn.execute("DELETE FROM ADJ_FACTORS WHERE CODE=?", (code,))
+        if len(rows):
+            dates, closes, lastCloses = zip(*rows)
+            DBInterface.__saveFactors(conn, code, *computeAdjustFactors(dates, closes, lastCloses))
+
+    @staticmethod
+    def __appendFactors(conn, code, records):
+        #records都比库中已有数据新，只需要和库中最后一个有效收盘价和最后一个累积因子衔接
+        records = sorted((record for record in records if record[0] == 0), key=lambda record: record[1])
+        if len(records) == 0:
             return
-        try:
-            if self.__conn is None:
-                self.__conn = sqlite3.connect(self.__path)
-            cmd = "INSERT INTO '{0}'(STATUS,DATE,CODE,NAME,TCLOSE,HIGH,LOW,TOPEN,LCLOSE,CHG,PCHG,TURNOVER,VOTURNOVER,VATURNOVER,TCAP,MCAP) \
-                VALUES({1},'{2}',{3}','{4}',{5},{6},{7},{8},{9},{10},{11},{12},{13},{14},{15},{16})".format(code,0,*args)
-            self.__conn.execute(cmd)
-        except sqlite3.OperationalError as e:
-            #数据不全，数据库添加标记
-            cmd = "INSERT INTO '{0}'(STATUS,DATE,CODE,NAME) \
-                VALUES({1},'{2}',{3}','{4}')".format(code,1,args[0],args[1],args[2])
-            self.__conn.execute(cmd)
-
-    def __commit(self):
-        if self.__conn is not None:
-            self.__conn.commit()
-            self.__conn.close()
-            self.__conn = None
+        row = conn.execute("SELECT TCLOSE FROM DAY_BARS WHERE CODE=? AND STATUS=0 AND DATE<? ORDER BY DATE DESC LIMIT 1",
+                           (code, records[0][1])).fetchone()
+        prevClose = row[0] if row is not None else np.nan
+        row = conn.execute("SELECT FACTOR FROM ADJ_FACTORS WHERE CODE=? ORDER BY DATE DESC LIMIT 1", (code,)).fetchone()
+        prevFactor = row[0] if row is not None else 1.0
+        dates = [record[1] for record in records]
+        closes = [record[4] for record in records]
+        lastCloses = [record[8] for record in records]
+        DBInterface.__saveFactors(conn, code, *computeAdjustFactors(dates, closes, lastCloses, prevClose, prevFactor))
+
+    @staticmethod
+    def __saveFactors(conn, code, dates, factors):
+        conn.executemany("INSERT OR REPLACE INTO ADJ_FACTORS(CODE,DATE,FACTOR) VALUES(?,?,?)",
+                         [(code, date, factor) for date, factor in zip(dates.tolist(), factors.tolist())])
+
+    def __getFactors(self, codes):
+        '''
+        :return: dict code->(除权日数组, 累积因子数组)
+        '''
+        cmd = "SELECT CODE,DATE,FACTOR FROM ADJ_FACTORS WHERE CODE IN ({0}) ORDER BY CODE ASC, DATE ASC".format(','.join('?'*len(codes)))
+        grouped = {}
+        for code, date, factor in self.__connection().execute(cmd, list(codes)):
+            grouped.setdefault(code, ([], []))
+            grouped[code][0].append(date)
+            grouped[code][1].append(factor)
+        return {code: (np.array(dates), np.array(factors)) for code, (dates, factors) in grouped.items()}
+
+    def rebuildAdjustFactors(self, codes=None):
+        '''
+        根据库中的除权数据重新计算复权因子，一般不需要调用
+        :param codes: 默认为库中所有股票
+        '''
+        if codes is None:
+            codes = list(self.__getCodes())
+        conn = self.__connection()
+        with conn:
+            for code in codes:
+                DBInterface.__rebuildFactors(conn, code)
+
+    def __getCodes(self):
+        conn = self.__connection()
+        with DBInterface.__lock:
+            codes = DBInterface.__codes.get(self.__path)
+            if codes is None:
+                codes = {row[0] for row in conn.execute('SELECT CODE FROM DAY_BARS_META')}
+                DBInterface.__codes[self.__path] = codes
+            return codes
+
+    def __has_code(self, code):
+        return code in self.__getCodes()
+
+    @staticmethod
+    def toRecord(code, row):
+        '''
+        将网易CSV的一行转换为DAY_BARS的一条记录
+        网易用None表示缺失的字段，数据不全时只保留日期和名称，并标记STATUS为1
+        '''
+        values = row[3:15]
+        if len(values) < 12 or 'None' in values:
+            return (1, row[0], code, row[2]) + (None,)*12
+        return (0, row[0], code, row[2]) + tuple(values)
+
+    def __insert(self, code, rows):
+        '''
+        写入一次同步下载的数据，即使没有新数据也会记录同步时间
+        '''
+        records = [DBInterface.toRecord(code, row) for row in rows if len(row)]
+        conn = self.__connection()
+        with conn:
+            meta = conn.execute("SELECT LATEST_DATE,ROW_COUNT FROM DAY_BARS_META WHERE CODE=?", (code,)).fetchone()
+            latestDate, rowCount = meta if meta is not None else (DBInterface.EMPTY_DATE, 0)
+            conn.executemany(DBInterface.INSERT_SQL, records)
+            if len(records):
+                dates = [record[1] for record in records]
+                if min(dates) > latestDate:
+                    #都是新日期，不会覆盖已有的行，发生除权时只需要追加复权因子
+                    rowCount += len(records)
+                    DBInterface.__appendFactors(conn, code, records)
+                else:
+                    rowCount = conn.execute("SELECT COUNT(*) FROM DAY_BARS WHERE CODE=?", (code,)).fetchone()[0]
+                    DBInterface.__rebuildFactors(conn, code)
+                latestDate = max(latestDate, max(dates))
+            conn.execute("INSERT OR REPLACE INTO DAY_BARS_META(CODE,LATEST_DATE,ROW_COUNT,LAST_SYNC) VALUES(?,?,?,?)",
+                         (code, latestDate, rowCount, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        self.__getCodes().add(code)
 
     def __clear_data(self, code):
-        if self.__has_table(code):
-            with sqlite3.connect(self.__path) as conn:
-                conn.execute("DELETE FROM '{0}'".format(code))
-                conn.commit()
+        conn = self.__connection()
+        with conn:
+            conn.execute("DELETE FROM DAY_BARS WHERE CODE=?", (code,))
+            conn.execute("DELETE FROM DAY_BARS_META WHERE CODE=?", (code,))
+            conn.execute("DELETE FROM ADJ_FACTORS WHERE CODE=?", (code,))
+        self.__getCodes().discard(code)
 
     def __clearAndDownloadToDB(self, code):
         '''
-        会先抹掉表中所有数据，谨慎使用!
-        一般情况下数据库数据应该是正确的，这个函数应近在特殊情况下被调用（比如初始状态或有除权发生）
+        会先抹掉该股票所有数据，谨慎使用!
+        一般情况下数据库数据应该是正确的，这个函数应近在特殊情况下被调用（比如初始状态），除权不需要重新下载
         '''
-        self.__create_table(code)
         self.__clear_data(code)
         #下载到今天为止的所有日线数据
         end_date = str(datetime.datetime.now().date())
-        data = wangyi.Quoter.getDayData(code, '1990-01-01', end_date)
-        for row in data:
-            self.__inset_without_commit(code, *row)
-        self.__commit()
+        self.__insert(code, wangyi.Quoter.getDayData(code, '1990-01-01', end_date))
 
     def __complementDB(self,code):
         '''
@@ -94,51 +277,257 @@ class DBInterface:
         :param code:
         :return:
         '''
-        latestDate = self.__getLatestDate(code)
+        start_date = self.__getMissingStartDate(code)
         today = str(datetime.datetime.now().date())
         #有段时间没开程序了
-        if latestDate<today:
-            start_date = datetime.datetime.strptime(latestDate,'%Y-%m-%d')+datetime.timedelta(days=1)
-            start_date = datetime.datetime.strftime(start_date,'%Y-%m-%d')
-            data = wangyi.Quoter.getDayData(code, start_date, today)
-            for row in data:
-                #插入会破坏数据库内部顺序，总是排序取出，不要依赖内部顺序
-                self.__inset_without_commit(code, *row)
-            self.__commit()
+        if start_date<=today:
+            self.__insert(code, wangyi.Quoter.getDayData(code, start_date, today))
+
+    def __getMissingStartDate(self, code):
+        latestDate = self.__getLatestDate(code)
+        start_date = datetime.datetime.strptime(latestDate,'%Y-%m-%d')+datetime.timedelta(days=1)
+        return datetime.datetime.strftime(start_date,'%Y-%m-%d')
+
+    @staticmethod
+    def __download(code, start_date, end_date):
+        #在下载线程中执行，只做网络请求和CSV解析，不碰数据库
+        return list(wangyi.Quoter.getDayData(code, start_date, end_date))
+
+    def updateMarket(self, codes, maxWorkers=8, progress=None):
+        '''
+        并发补齐多只股票的日线数据，适合每天收盘后同步整个市场
+        下载在有界线程池中并发进行，每个线程复用自己的keep-alive连接
+        数据库只在调用线程中写入，每只股票下载完成后立即在一个事务中批量写入
+        :param codes: 股票代码列表
+        :param maxWorkers: 并发下载的线程数
+        :param progress: 每只股票完成后的回调 progress(code, rowCount, finished, total, error)，成功时error为None
+        :return: 下载或写入失败的股票，dict code->exception
+        '''
+        today = str(datetime.datetime.now().date())
+        total = len(codes)
+        finished = 0
+        errors = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            futures = {}
+            for code in codes:
+                start_date = self.__getMissingStartDate(code)
+                if start_date > today:
+                    #已经是最新的
+                    finished += 1
+                    if progress is not None:
+                        progress(code, 0, finished, total, None)
+                    continue
+                futures[executor.submit(DBInterface.__download, code, start_date, today)] = code
+
+            for future in concurrent.futures.as_completed(futures):
+                code = futures[future]
+                rowCount = 0
+                error = None
+                try:
+                    rows = future.result()
+                    self.__insert(code, rows)
+                    rowCount = len(rows)
+                except Exception as e:
+                    logger.error('failed to update %s: %s' % (code, e))
+                    errors[code] = e
+                    error = e
+                finished += 1
+                if progress is not None:
+                    progress(code, rowCount, finished, total, error)
+        return errors
 
     def __getLatestDate(self,code):
-        with sqlite3.connect(self.__path) as conn:
-            cursor = conn.execute("SELECT DATE FROM '%s' ORDER BY DATE DESC" % code)
-            for row in cursor:
-                return row[0]
-        #空表
-        return '1989-12-31'
+        row = self.__connection().execute("SELECT LATEST_DATE FROM DAY_BARS_META WHERE CODE=?", (code,)).fetchone()
+        if row is not None:
+            return row[0]
+        #没有数据
+        return DBInterface.EMPTY_DATE
 
-    def loadDayDataToStock(self, stock, start_date='1990-01-01', end_date=None):
+    def getMeta(self, code):
+        '''
+        :return: (最新日期, 行数, 最近同步时间)，数据库中没有该股票时返回None
+        '''
+        return self.__connection().execute("SELECT LATEST_DATE,ROW_COUNT,LAST_SYNC FROM DAY_BARS_META WHERE CODE=?",
+                                           (code,)).fetchone()
+
+    def getStaleCodes(self, date=None):
+        '''
+        返回在某天之后还没有同步过的股票代码，可直接交给updateMarket
+        :param date: 日期，格式2018-01-01，默认为今天
+        :return: list of code
+        '''
+        if date is None:
+            date = str(datetime.datetime.now().date())
+        cursor = self.__connection().execute("SELECT CODE FROM DAY_BARS_META WHERE LAST_SYNC IS NULL OR LAST_SYNC<?",
+                                             (date,))
+        return [row[0] for row in cursor]
+
+    def __prepare(self, code):
+        if not self.__has_code(code):
+            self.__clearAndDownloadToDB(code)
+        self.__complementDB(code)
+
+    #旧版单股票表的列
+    LEGACY_COLUMNS = ('STATUS', 'DATE', 'CODE', 'NAME', 'TCLOSE', 'HIGH', 'LOW', 'TOPEN', 'LCLOSE', 'CHG', 'PCHG',
+                      'TURNOVER', 'VOTURNOVER', 'VATURNOVER', 'TCAP', 'MCAP')
+
+    @staticmethod
+    def __isLegacyTable(conn, table):
+        columns = [row[1].upper() for row in conn.execute("PRAGMA table_info('{0}')".format(table))]
+        return sorted(columns) == sorted(DBInterface.LEGACY_COLUMNS)
+
+    def importLegacyTables(self):
+        '''
+        将旧版本一只股票一张表的数据导入DAY_BARS，旧表保留不删除
+        只需在升级后调用一次
+        :return:导入的股票代码
+        '''
+        conn = self.__connection()
+        #只导入列与旧版单股票表一致的表，DAY_BARS、DAY_BARS_META、ADJ_FACTORS及其他无关的表都跳过
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN "
+                                                  "('DAY_BARS','DAY_BARS_META','ADJ_FACTORS')")]
+        codes = [table for table in tables if DBInterface.__isLegacyTable(conn, table)]
+        with conn:
+            for code in codes:
+                conn.execute("INSERT OR IGNORE INTO DAY_BARS(STATUS,DATE,CODE,NAME,TCLOSE,HIGH,LOW,TOPEN,LCLOSE,CHG,PCHG,"
+                             "TURNOVER,VOTURNOVER,VATURNOVER,TCAP,MCAP) "
+                             "SELECT STATUS,DATE,'{0}',NAME,TCLOSE,HIGH,LOW,TOPEN,LCLOSE,CHG,PCHG,"
+                             "TURNOVER,VOTURNOVER,VATURNOVER,TCAP,MCAP FROM '{0}'".format(code))
+            DBInterface.__rebuildMeta(conn)
+            for code in codes:
+                DBInterface.__rebuildFactors(conn, code)
+        DBInterface.__codes.pop(self.__path, None)
+        return codes
+
+    def loadDayDataToStock(self, stock, start_date='1990-01-01', end_date=None, bufferLast=False):
         '''
         将数据库中数据拷贝到全新的stock中，为避免重复拷贝，直接操作Stock
         :param stock:
         :param start_date:
         :param end_date:
+        :param bufferLast: 见Stock.extend
         :return:
         '''
-        #确保stock是空的
-        assert len(stock[Frequency.DAY])==0
+        self.loadDayDataToStocks([stock], start_date, end_date, bufferLast)
 
-        code = stock.code
-        if not self.__has_table(code):
-            self.__clearAndDownloadToDB(code)
-        self.__complementDB(code)
+    def loadDayDataToStocks(self, stocks, start_date='1990-01-01', end_date=None, bufferLast=False):
+        '''
+        一次查询将多只股票的日线数据拷贝到全新的stock中，适合载入整个市场
+        :param stocks: Stock列表
+        :param start_date:
+        :param end_date:
+        :param bufferLast: 见Stock.extend
+        :return:
+        '''
+        stocks = {stock.code: stock for stock in stocks}
+        for code, stock in stocks.items():
+            #确保stock是空的
+            assert len(stock[Frequency.DAY])==0
+            self.__prepare(code)
 
         if end_date is None:
             end_date = datetime.datetime.today().date().strftime('%Y-%m-%d')
-        with sqlite3.connect(self.__path) as conn:
-            cmd = "SELECT STATUS,DATE,TCLOSE,HIGH,LOW,TOPEN,VOTURNOVER FROM '{0}' WHERE DATE>='{1}' AND DATE<='{2}' ORDER By DATE ASC ".format(code,start_date,end_date)
-            cursor = conn.execute(cmd)
-            for row in cursor:
-                if row[0]==1:
-                    raise RuntimeError('data missing for %s %s'% (row[1],code))
-                stock.append(Bar(row[1],row[5],row[3],row[4],row[2],row[6],Frequency.DAY))
+        codes = list(stocks.keys())
+        conn = self.__connection()
+        #按主键顺序扫描，结果已按(CODE, DATE)排好序
+        for i in range(0, len(codes), DBInterface.QUERY_BATCH_SIZE):
+            batch = codes[i:i+DBInterface.QUERY_BATCH_SIZE]
+            cmd = "SELECT CODE,STATUS,DATE,TCLOSE,HIGH,LOW,TOPEN,VOTURNOVER FROM DAY_BARS " \
+                  "WHERE CODE IN ({0}) AND DATE>=? AND DATE<=? ORDER BY CODE ASC, DATE ASC".format(','.join('?'*len(batch)))
+            rows = conn.execute(cmd, batch + [start_date, end_date]).fetchall()
+            factors = self.__getFactors(batch)
+            begin = 0
+            for end in range(1, len(rows)+1):
+                #每只股票的数据是连续的一段
+                if end == len(rows) or rows[end][0] != rows[begin][0]:
+                    code = rows[begin][0]
+                    stocks[code].extend(DBInterface.__toBars(rows[begin:end], factors.get(code)), bufferLast)
+                    begin = end
+
+    @staticmethod
+    def __toBars(rows, factors):
+        '''
+        :param rows: 同一只股票按日期升序的 CODE,STATUS,DATE,TCLOSE,HIGH,LOW,TOPEN,VOTURNOVER
+        :param factors: (除权日数组, 累积因子数组)，没有除权时为None
+        '''
+        if len(rows) == 0:
+            return []
+        for row in rows:
+            if row[1]==1:
+                raise RuntimeError('data missing for %s %s'% (row[2],row[0]))
+        codes, status, dates, closes, highs, lows, opens, volumes = zip(*rows)
+        prices = np.array([opens, highs, lows, closes], dtype=float).T
+        if factors is not None:
+            forwardAdjust(np.array(dates), prices, *factors)
+        return [Bar(date,open_,high,low,close,volume,Frequency.DAY)
+                for date, (open_, high, low, close), volume in zip(dates, prices.tolist(), volumes)]
+
+    def __queryLatest(self, code, condition, date, count):
+        #主键上的逆序范围扫描，只读取需要的行
+        cmd = "SELECT CODE,STATUS,DATE,TCLOSE,HIGH,LOW,TOPEN,VOTURNOVER FROM DAY_BARS " \
+              "WHERE CODE=? AND DATE{0}? ORDER BY DATE DESC LIMIT ?".format(condition)
+        rows = self.__connection().execute(cmd, (code, date, count)).fetchall()
+        return DBInterface.__toBars(rows[::-1], self.__getFactors([code]).get(code))
+
+    def loadLatestDayDataToStock(self, stock, count, end_date=None, bufferLast=False):
+        '''
+        只将end_date及之前最近的count个日线载入全新的stock中，用于按需载入
+        :param bufferLast: 见Stock.extend
+        '''
+        assert len(stock[Frequency.DAY])==0
+        self.__prepare(stock.code)
+        if end_date is None:
+            end_date = datetime.datetime.today().date().strftime('%Y-%m-%d')
+        stock.extend(self.__queryLatest(stock.code, '<=', end_date, count), bufferLast)
+
+    def getDayBarsBefore(self, code, date, count):
+        '''
+        返回date之前（不含date）最近的count个日线，按日期升序
+        '''
+        return self.__queryLatest(code, '<', date, count)
+
+
+#A股交易时段，以分钟计
+MORNING_OPEN = 9*60+30
+MORNING_CLOSE = 11*60+30
+AFTERNOON_OPEN = 13*60
+DAY_CLOSE_TIME = '15:00:00'
+#一个交易日的5分钟Bar数量
+FIVE_MINUTE_BARS_PER_DAY = (MORNING_CLOSE - MORNING_OPEN + 15*60 - AFTERNOON_OPEN) // 5
+
+
+def getPeriodEnd(dateTime, frequency):
+    '''
+    返回一个5分钟Bar所属的更高周期Bar的时间，日内周期按A股交易时段切分，跳过午间休市
+    如60分钟Bar为10:30,11:30,14:00,15:00
+    :param dateTime: 5分钟Bar的结束时间，格式2018-01-01 09:35:00
+    :param frequency: 15分钟，30分钟，60分钟或日
+    '''
+    if frequency == Frequency.DAY:
+        return dateTime[:10]
+    minutes = int(dateTime[11:13])*60 + int(dateTime[14:16])
+    if minutes <= MORNING_CLOSE:
+        elapsed = minutes - MORNING_OPEN
+    else:
+        elapsed = MORNING_CLOSE - MORNING_OPEN + minutes - AFTERNOON_OPEN
+    period = frequency // 60
+    #向上取整到周期末尾，集合竞价的Bar归入第一个周期
+    elapsed = max(-(-elapsed // period) * period, period)
+    if elapsed <= MORNING_CLOSE - MORNING_OPEN:
+        minutes = MORNING_OPEN + elapsed
+    else:
+        minutes = AFTERNOON_OPEN + elapsed - (MORNING_CLOSE - MORNING_OPEN)
+    return '%s %02d:%02d:00' % (dateTime[:10], minutes // 60, minutes % 60)
+
+
+def mergeBars(first, last, dateTime, frequency):
+    '''
+    合并两个相邻的Bar，first为None时相当于改变last的时间和周期
+    '''
+    if first is None:
+        return Bar(dateTime, last.open, last.high, last.low, last.close, last.volume, frequency)
+    return Bar(dateTime, first.open, max(first.high, last.high), min(first.low, last.low), last.close,
+               first.volume + last.volume, frequency)
 
 
 class Stock:
@@ -149,8 +538,12 @@ class Stock:
     使用前复权数据，不要复权日当天交易该之股票
     周线及以上周期需特殊处理，暂不支持
     不支持动态修改分析周期
+    分析周期包含5分钟时，默认由5分钟Bar在本地合成15分钟、30分钟、60分钟和日线，实时数据源只需要获取5分钟数据
     '''
-    def __init__(self, code, periods=None):
+    #可以由5分钟Bar合成的周期
+    DERIVABLE_PERIODS = (Frequency.FIFTEEN_MINUTE, Frequency.THIRTY_MINUTE, Frequency.HOUR, Frequency.DAY)
+
+    def __init__(self, code, periods=None, derivePeriods=True):
         self.__code = code
         if periods is None:
             #没有找到在线1分钟数据源，采用5分钟为最小周期
@@ -162,6 +555,12 @@ class Stock:
                        Frequency.DAY)
         self.__periods = periods
         self.__barSeries = {frequency:BufferedBarDataSeries() for frequency in periods}
+        if derivePeriods and Frequency.FIVE_MINUTE in periods:
+            self.__derivedPeriods = tuple(f for f in Stock.DERIVABLE_PERIODS if f in periods)
+        else:
+            self.__derivedPeriods = ()
+        #合成周期 -> [当前周期的时间, 当前周期内已完成的5分钟Bar的合并结果]
+        self.__aggregates = {frequency:[None, None] for frequency in self.__derivedPeriods}
         self._lastPrice =None
         self.__highLimit = None
         self.__lowLimit = None
@@ -178,9 +577,65 @@ class Stock:
 
     def append(self,bar):
         self.__barSeries[bar.frequency].append(bar.dateTime, bar)
+        if bar.frequency == Frequency.FIVE_MINUTE:
+            self.__aggregate(bar, True)
 
     def update(self,bar):
         self.__barSeries[bar.frequency].update(bar.dateTime, bar)
+        if bar.frequency == Frequency.FIVE_MINUTE:
+            self.__aggregate(bar, False)
+
+    def extend(self, bars, bufferLast=False):
+        '''
+        一次追加多个同一周期的历史Bar，技术指标按批量方式计算，不触发5分钟Bar的合成
+        :param bufferLast: 为True时最后一个Bar以缓存状态载入，它可能是还未完成的Bar，之后的实时数据可以继续更新它
+        '''
+        if len(bars):
+            series = self.__barSeries[bars[0].frequency]
+            committed = bars[:-1] if bufferLast else bars
+            series.extend([bar.dateTime for bar in committed], committed)
+            if bufferLast:
+                series.update(bars[-1].dateTime, bars[-1])
+
+    def __aggregate(self, bar, commit):
+        '''
+        :param commit: True表示5分钟Bar已完成，False表示5分钟Bar仍在更新中
+        '''
+        for frequency in self.__derivedPeriods:
+            series = self.__barSeries[frequency]
+            state = self.__aggregates[frequency]
+            dateTime = getPeriodEnd(bar.dateTime, frequency)
+            if state[0] != dateTime:
+                #新周期开始，上一个周期没有等到最后一个5分钟Bar时在这里完成
+                #刚载入数据时缓存中可能就是当前周期的Bar，不能提交，之后继续更新它
+                if series.isBuffering() and series.dateTimes[-1] != dateTime:
+                    series.append(series.dateTimes[-1], series[-1])
+                state[0] = dateTime
+                state[1] = self.__mergeEarlierBars(bar, dateTime, frequency)
+            merged = mergeBars(state[1], bar, dateTime, frequency)
+            closing = commit and (bar.dateTime[11:] == DAY_CLOSE_TIME if frequency == Frequency.DAY
+                                  else bar.dateTime == dateTime)
+            if commit:
+                state[1] = merged
+            if len(series) and (series.dateTimes[-1] > dateTime or
+                                (series.dateTimes[-1] == dateTime and not series.isBuffering())):
+                #载入的历史数据已经包含这个周期
+                continue
+            if closing:
+                series.append(dateTime, merged)
+            else:
+                series.update(dateTime, merged)
+
+    def __mergeEarlierBars(self, bar, dateTime, frequency):
+        #周期中途开始合成时（如刚载入数据），先合并5分钟序列中同一周期内更早的Bar
+        fiveMinute = self.__barSeries[Frequency.FIVE_MINUTE]
+        i = len(fiveMinute) - 2
+        while i >= 0 and fiveMinute.dateTimes[i] < bar.dateTime and getPeriodEnd(fiveMinute.dateTimes[i], frequency) == dateTime:
+            i -= 1
+        merged = None
+        for j in range(i+1, len(fiveMinute)-1):
+            merged = mergeBars(merged, fiveMinute[j], dateTime, frequency)
+        return merged
 
     @property
     def code(self):
@@ -190,16 +645,53 @@ class Stock:
     def analysisPeriods(self):
         return self.__periods
 
-    def loadData(self,star_date='1990-01-01',end_date = None):
+    @property
+    def livePeriods(self):
+        '''
+        需要从实时数据源获取的周期，不包括由5分钟Bar合成的周期
+        '''
+        return tuple(f for f in self.__periods if f not in self.__derivedPeriods)
+
+    def loadData(self,star_date='1990-01-01',end_date = None, lazy=False):
+        '''
+        :param lazy: 为True时忽略star_date，每个周期只载入已注册技术指标所需的预热窗口，
+                     更早的数据在负索引超出窗口时按需载入，因此技术指标要在载入数据之前设置好
+        每个周期的最后一个Bar以缓存状态载入，它可能还未完成，实时数据源会继续更新它
+        '''
         #TODO 暂时只在线载入日内K线，先不维护数据库
         for frequency in self.__periods:
-            assert not self.__barSeries[frequency].isBuffering()
+            series = self.__barSeries[frequency]
+            assert not series.isBuffering()
+            #至少载入一个Bar，实时数据源需要和最后一个Bar比较
+            warmUp = max(series.historyRequirement, 1)
             if frequency==Frequency.DAY:
-                self.__wangyiDB.loadDayDataToStock(self, star_date, end_date)
+                if lazy:
+                    self.__wangyiDB.loadLatestDayDataToStock(self, warmUp, end_date, True)
+                    series.setHistoryLoader(self.__loadDayHistory)
+                else:
+                    self.__wangyiDB.loadDayDataToStock(self, star_date, end_date, True)
             else:
-                for d in sina.Quoter.getIntraDayQuote(self.__code,frequency/60):
-                    bar = Bar(d['day'],float(d['open']),float(d['high']),float(d['low']),float(d['close']),int(d['volume']),frequency)
-                    self.__barSeries[frequency].append(bar.dateTime,bar)
+                datalen = warmUp if lazy else sina.Quoter.MAX_DATALEN
+                if frequency == Frequency.FIVE_MINUTE and self.__derivedPeriods:
+                    #合成周期的Bar由同一周期内的5分钟Bar重新合并得到，至少载入一个交易日，
+                    #否则实时更新会用不完整的5分钟Bar覆盖载入的合成周期Bar
+                    datalen = max(datalen, FIVE_MINUTE_BARS_PER_DAY)
+                bars = Stock.__getIntraDayBars(self.__code, frequency, datalen)
+                self.extend(bars, True)
+                if lazy:
+                    series.setHistoryLoader(functools.partial(self.__loadIntraDayHistory, frequency))
+
+    @staticmethod
+    def __getIntraDayBars(code, frequency, datalen):
+        return sina.Quoter.toBars(sina.Quoter.getIntraDayQuote(code,frequency//60,datalen=datalen), frequency)
+
+    def __loadDayHistory(self, dateTime, count):
+        return self.__wangyiDB.getDayBarsBefore(self.__code, dateTime, count)
+
+    def __loadIntraDayHistory(self, frequency, dateTime, count):
+        #新浪只提供最近的数据，取全部后截取dateTime之前的部分
+        bars = [bar for bar in Stock.__getIntraDayBars(self.__code, frequency, sina.Quoter.MAX_DATALEN) if bar.dateTime < dateTime]
+        return bars[-count:]
 
     def save(self):
         for f in self.__barSeries:
@@ -0,0 +1,18 @@
+import threading
+import requests
+
+
+_local = threading.local()
+
+
+def getSession():
+    '''
+    返回当前线程的requests.Session，同一线程内的请求复用keep-alive连接
+    requests.Session不保证线程安全，所以每个线程各用一个
+    :return: requests.Session
+    '''
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
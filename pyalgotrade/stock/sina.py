@@ -1,10 +1,17 @@
 from pyalgotrade.utils import addSinaPrefix,CSVStringHelper
 from pyalgotrade.feed import BaseLiveFeed
 from pyalgotrade.stock.bar import Frequency,Bar
+from pyalgotrade.stock.session import getSession
+import numpy as np
+import re
 import requests
 
 
-d1 = {'day':'day','open':'open','close':'close','high':'high','low':'low','volume':'volume'}
+#K线接口返回形如[{day:"2018-09-10 14:55:00",open:"10.110",high:"10.120",low:"10.100",close:"10.110",volume:"123400"},...]
+#的数据，字段名可能带引号，volume之后可能还有其他字段
+KLINE_PATTERN = re.compile(r'"?day"?:"([^"]*)","?open"?:"([^"]*)","?high"?:"([^"]*)","?low"?:"([^"]*)",'
+                           r'"?close"?:"([^"]*)","?volume"?:"([^"]*)"')
+KLINE_FIELDS = ('day','open','high','low','close','volume')
 
 headers1 = {
 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
@@ -16,6 +23,10 @@ headers1 = {
 
 class Quoter:
     cookies = {5:{},15:{},30:{},60:{}}
+    #K线接口一次最多返回的数据个数
+    MAX_DATALEN = 1023
+    #实时行情接口一次请求的股票数量，受URL长度限制
+    RT_BATCH_SIZE = 800
     '''
     新浪api封装，所有类都是静态方法
     '''
@@ -25,20 +36,88 @@ class Quoter:
         response.raise_for_status()
         return response.text.split(',')
 
-    def getIntraDayQuote(code,period=5,timeout=5):
+    def getRTQuotes(codes,timeout=5):
+        '''
+        批量获取实时行情，每RT_BATCH_SIZE只股票一个请求
+        :param codes: 股票代码列表
+        :return: dict code->list，list的下标含义与getRTQuote相同，没有行情（如代码错误）的股票不在结果中
+        '''
+        ret = {}
+        session = getSession()
+        for i in range(0, len(codes), Quoter.RT_BATCH_SIZE):
+            batch = codes[i:i+Quoter.RT_BATCH_SIZE]
+            url = "http://hq.sinajs.cn/list=%s" % ','.join(addSinaPrefix(code) for code in batch)
+            response = session.get(url,timeout=timeout)
+            response.raise_for_status()
+            ret.update(Quoter.parseRTQuotes(response.text))
+        return ret
+
+    def parseRTQuotes(text):
+        '''
+        解析形如 var hq_str_sh600000="浦发银行,...,2018-09-10,15:00:00,00"; 的多行实时行情
+        '''
+        ret = {}
+        for line in text.split(';'):
+            begin = line.find('hq_str_')
+            if begin < 0:
+                continue
+            quote = line.find('="', begin)
+            content = line[quote+2:line.rfind('"')]
+            if len(content) == 0:
+                continue
+            #去掉sh,sz前缀
+            ret[line[begin+9:quote]] = content.split(',')
+        return ret
+
+    def getIntraDayQuote(code,period=5,timeout=5,datalen=MAX_DATALEN):
         '''
         获取5,15,30,60分钟数据，只能获取不到300条数据，似乎并不是1023条
         :param period: :type int
         :param timeout:
-        :return:list of dict
+        :param datalen: 最多返回最近的多少条数据
+        :return: dict，格式同parseIntraDayQuote
         '''
         url = "http://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData?" \
-              "symbol=%s&scale=%d&ma=no&datalen=1023" % (addSinaPrefix(code),period)
-        response = requests.get(url, timeout=timeout, headers=headers1, cookies=Quoter.cookies[period])
+              "symbol=%s&scale=%d&ma=no&datalen=%d" % (addSinaPrefix(code),period,datalen)
+        response = getSession().get(url, timeout=timeout, headers=headers1, cookies=Quoter.cookies[period])
         if response.cookies:
             Quoter.cookies[period] = response.cookies
         response.raise_for_status()
-        return eval(response.text,d1)
+        return Quoter.parseIntraDayQuote(response.text, datalen)
+
+    def parseIntraDayQuote(text, count=None):
+        '''
+        解析K线接口返回的数据
+        :param count: 只解析最后count条数据，为None时解析全部
+        :return: dict 字段名->numpy数组，day为datetime64[s]，volume为int64，其他为float64，按时间升序
+        '''
+        if count is not None:
+            #每条数据以{开头，从尾部向前找到第count条的起始位置，跳过前面的数据
+            begin = len(text)
+            for _ in range(count):
+                begin = text.rfind('{', 0, begin)
+                if begin < 0:
+                    begin = 0
+                    break
+            text = text[begin:]
+        rows = KLINE_PATTERN.findall(text)
+        if len(rows) == 0:
+            return {'day':np.empty(0, dtype='datetime64[s]'), 'open':np.empty(0), 'high':np.empty(0),
+                    'low':np.empty(0), 'close':np.empty(0), 'volume':np.empty(0, dtype=np.int64)}
+        columns = np.array(rows).T
+        ret = {field:columns[i].astype(float) for i, field in enumerate(KLINE_FIELDS[1:5], 1)}
+        ret['day'] = columns[0].astype('datetime64[s]')
+        ret['volume'] = columns[5].astype(np.int64)
+        return ret
+
+    def toBars(data, frequency):
+        '''
+        把parseIntraDayQuote的结果转换为Bar列表，时间转换回'2018-09-10 14:55:00'格式的字符串
+        '''
+        dateTimes = np.char.replace(np.datetime_as_string(data['day'], unit='s'), 'T', ' ').tolist()
+        return [Bar(*values, frequency) for values in zip(dateTimes, data['open'].tolist(), data['high'].tolist(),
+                                                          data['low'].tolist(), data['close'].tolist(),
+                                                          data['volume'].tolist())]
 
     def getAllCloseData(code,fq='houfuquan',timeout=5):
         '''
@@ -56,43 +135,72 @@ class Quoter:
 
 
 class LiveFeed(BaseLiveFeed):
-    def getNextBar(self,code,frequency):
+    #实时更新只需要最新的两个Bar
+    LIVE_DATALEN = 2
+
+    def __init__(self, maxWorkers=8):
+        super().__init__(maxWorkers)
+        self.__quotes = {}
+
+    def beforeDispatch(self):
+        #所有股票的日线实时行情合并成几个请求一次取回
+        codes = [code for code in self.codes if Frequency.DAY in self[code].livePeriods]
+        self.__quotes = Quoter.getRTQuotes(codes) if len(codes) else {}
+
+    def fetchBarData(self,code,frequency):
+        if frequency==Frequency.DAY:
+            return self.__quotes.get(code)
+        data = Quoter.getIntraDayQuote(code,frequency//60,datalen=LiveFeed.LIVE_DATALEN)
+        #没有数据时当作获取失败，本轮跳过；刚开盘时数据中只有一个bar，getNextBar可以处理
+        if len(data['day']) == 0:
+            raise ValueError('no bars in the reply')
+        return data
+
+    def getNextBar(self,code,frequency,data):
         stock = self[code]
         last_bar = stock[frequency][-1]
         if frequency==Frequency.DAY:
-            l = Quoter.getRTQuote(code)
+            l = data
+            if l is None:
+                return None,None
             bar = Bar(l[-3],float(l[1]),float(l[4]),float(l[5]),float(l[3]),int(l[8]),frequency)
             if bar.dateTime==last_bar.dateTime:
-                #数据未更新
-                if bar == last_bar:
+                #数据未更新，或者该bar已经作为历史数据提交
+                if bar == last_bar or not stock[frequency].isBuffering():
                     return None,None
                 return bar,True
             elif bar.dateTime>last_bar.dateTime:
-                return bar,False
+                #前一天的bar以最后一次行情为准提交，新的bar在收盘前都处于缓存状态
+                if stock[frequency].isBuffering():
+                    stock.append(last_bar)
+                return bar,True
             else:
                 raise RuntimeError("new bar's datetime cannot be less than old one")
         else:
-            l = Quoter.getIntraDayQuote(code,frequency/60)
-            bar = l[-1]
-            bar = Bar(bar['day'],float(bar['open']),float(bar['high']),float(bar['low']),
-                      float(bar['close']),int(bar['volume']),frequency)
+            bars = Quoter.toBars(data, frequency)
+            bar = bars[-1]
             if bar.dateTime == last_bar.dateTime:
                 assert bar.volume>=last_bar.volume,(str(last_bar),str(bar))
-                #数据未更新
-                if bar == last_bar:
+                #数据未更新，或者该bar已经作为历史数据提交
+                if bar == last_bar or not stock[frequency].isBuffering():
                     return None,None
                 return bar,True
             elif bar.dateTime > last_bar.dateTime:
                 #有新的bar出现，看下上一个bar是否需要做最后更新
-                bar2 = l[-2]
-                bar2 = Bar(bar2['day'], float(bar2['open']), float(bar2['high']), float(bar2['low']),
-                           float(bar2['close']), int(bar2['volume']), frequency)
-                assert bar2.dateTime==last_bar.dateTime
-                #若前一个bar状态有更新则强制改变buffer状态
-                if bar2 != last_bar:
-                    print('漏更新')
-                    stock.append(last_bar)
-                return bar,False
+                #上一个bar还在缓存中时先以最终状态提交，否则新bar会覆盖它
+                series = stock[frequency]
+                for bar2 in bars[:-1]:
+                    if bar2.dateTime > last_bar.dateTime:
+                        #错过了轮询，补上中间已经完成的bar
+                        if series.isBuffering():
+                            stock.append(series[-1])
+                        stock.append(bar2)
+                    elif bar2.dateTime == last_bar.dateTime and series.isBuffering():
+                        stock.append(bar2)
+                if series.isBuffering():
+                    #数据中已经没有上一个bar，以缓存中的最后状态提交
+                    stock.append(series[-1])
+                return bar,True
             else:
                  raise RuntimeError("new bar's datetime %s cannot be less than old one %s" %(bar.dateTime,last_bar.dateTime))
 
@@ -1,4 +1,5 @@
 from pyalgotrade.utils import addWangyiPrefix,CSVStringHelper
+from pyalgotrade.stock.session import getSession
 import requests
 import csv
 
@@ -18,7 +19,8 @@ class Quoter:
                                 "code={0}&start={1}&end={2}&fields="
                                  "TCLOSE;HIGH;LOW;TOPEN;LCLOSE;CHG;PCHG;TURNOVER;VOTURNOVER;VATURNOVER;TCAP;MCAP"
                .format(addWangyiPrefix(code), start_date.replace('-', ''), end_date.replace('-', '')))
-        response = requests.get(url,timeout=timeout)
+        #复用当前线程的keep-alive连接，批量更新时能省掉大部分建连开销
+        response = getSession().get(url,timeout=timeout)
         response.raise_for_status()
         content =CSVStringHelper(response.text)
 #        with open('tmp.csv','w') as f:
@@ -25,6 +25,7 @@ import pyalgotrade.broker
 from pyalgotrade.broker import backtesting
 from pyalgotrade import observer
 from pyalgotrade import dispatcher
+from pyalgotrade import asyncdispatcher
 import pyalgotrade.strategy.position
 from pyalgotrade import logger
 from pyalgotrade.barfeed import resampled
@@ -53,7 +54,7 @@ class BaseStrategy(object, metaclass=abc.ABCMeta):
         self.__analyzers = []
         self.__namedAnalyzers = {}
         self.__resampledBarFeeds = []
-        self.__dispatcher = dispatcher.Dispatcher()
+        self.__dispatcher = self.createDispatcher()
         self.__broker.getOrderUpdatedEvent().subscribe(self.__onOrderEvent)
         self.__barFeed.getNewValuesEvent().subscribe(self.__onBars)
 
@@ -67,6 +68,10 @@ class BaseStrategy(object, metaclass=abc.ABCMeta):
         # Initialize logging.
         self.__logger = logger.getLogger(BaseStrategy.LOGGER_NAME)
 
+    def createDispatcher(self):
+        """Returns the dispatcher that will run the strategy. Called once from the constructor."""
+        return dispatcher.Dispatcher()
+
     # Only valid for testing purposes.
     def _setBroker(self, broker):
         self.__broker = broker
@@ -604,6 +609,7 @@ class BacktestingStrategy(BaseStrategy):
 
 class BaseLiveStrategy(BaseStrategy):
     '''
-    在线策略的基类
+    在线策略的基类，使用asyncio的dispatcher，实现了nextEvent的实时数据源不再轮询
     '''
-    pass
+    def createDispatcher(self):
+        return asyncdispatcher.AsyncDispatcher()
@@ -20,6 +20,20 @@
 
 from pyalgotrade.utils import collections
 from pyalgotrade import dataseries
+import numpy as np
+
+
+def batch_values(values, firstValue):
+    """Turns the output of a vectorised calculation into a list with None for the first firstValue positions.
+
+    :param values: The calculated values, starting at position firstValue.
+    """
+    return [None] * firstValue + np.asarray(values).tolist()
+
+
+def rolling_window(values, windowSize):
+    """Returns a read-only (len(values) - windowSize + 1, windowSize) view with one row per full window."""
+    return np.lib.stride_tricks.sliding_window_view(np.asarray(values, dtype=float), windowSize)
 
 
 class EventWindow:
@@ -42,6 +56,7 @@ class EventWindow:
         # use buffered one instead
         self.__values = collections.BufferedNumPyDeque(windowSize, dtype)
         self.__windowSize = windowSize
+        self.__droppedValue = None
 
     def __iter__(self):
         return iter(self.__values)
@@ -54,18 +69,31 @@ class EventWindow:
 
     def onNewValue(self, dateTime, value):
         assert dateTime is not None and value is not None
+        if not self.__values.isBuffering():
+            self.__droppedValue = self.__values[0] if self.isFull() else None
         self.__values.append(value)
 
     def onUpdateValue(self, dateTime, value):
         assert dateTime is not None and value is not None
+        if not self.__values.isBuffering():
+            self.__droppedValue = self.__values[0] if self.isFull() else None
         self.__values.update(value)
 
+    def isBuffering(self):
+        """Returns True if the last value in the window is a tentative one from onUpdateValue."""
+        return self.__values.isBuffering()
+
+    def droppedValue(self):
+        """Returns the committed value that left the window when the slot for the last value was added,
+        or None if the window was not full at that time. Used by windows that keep running sums."""
+        return self.__droppedValue
+
     def data(self):
         '''
         为了避免数据复制，返回的是引用数据，注意不能要修改源数据
         :return:
         '''
-        return self.__values._BufferedNumpyDeque__data
+        return self.__values.data()
 
     @property
     def windowSize(self):
@@ -79,6 +107,45 @@ class EventWindow:
         """Override to calculate a value using the values in the window."""
         raise NotImplementedError()
 
+    def computeBatch(self, dateTimes, values):
+        """Feeds many new values at once and returns the list of calculated values, one per input value.
+        None inputs produce None and are not added to the window.
+
+        When the window is empty and there are no None values other than a leading run (a source filter warming
+        up), :meth:`computeHistory` gets the chance to do it vectorised. Otherwise values are fed one by one.
+        """
+        skip = 0
+        while skip < len(values) and values[skip] is None:
+            skip += 1
+        if len(self) == 0 and skip < len(values) and all(value is not None for value in values[skip:]):
+            ret = self.computeHistory(dateTimes[skip:], values[skip:])
+            if ret is not None:
+                return [None] * skip + ret
+        ret = []
+        for dateTime, value in zip(dateTimes, values):
+            if value is None:
+                ret.append(None)
+            else:
+                self.onNewValue(dateTime, value)
+                ret.append(self.calculate())
+        return ret
+
+    def computeHistory(self, dateTimes, values):
+        """Override to calculate the values for a whole history at once, usually with numpy.
+        Only called with an empty window and without None values.
+
+        Must return a list with one value per input value, and leave the window in the same state as if the values
+        had been fed one by one (:meth:`replay` does that for windows that only depend on their last values).
+        Returns None if not supported, in which case values are fed one by one.
+        """
+        return None
+
+    def replay(self, dateTimes, values):
+        """Feeds the last windowSize values through onNewValue, which restores the state of windows that only
+        depend on the values they hold."""
+        for dateTime, value in zip(dateTimes[-self.__windowSize:], values[-self.__windowSize:]):
+            self.onNewValue(dateTime, value)
+
 
 class EventBasedFilter(dataseries.BufferedSequenceDataSeries):
     """An EventBasedFilter class is responsible for capturing new values in a :class:`pyalgotrade.dataseries.DataSeries`
@@ -98,10 +165,21 @@ class EventBasedFilter(dataseries.BufferedSequenceDataSeries):
         super().__init__()
         self.__dataSeries = dataSeries
         self.__dataSeries.newValueEvent.subscribe(self.__onNewValue)
+        self.__dataSeries.newValuesEvent.subscribe(self.__onNewValues)
         self.__dataSeries.updateValueEvent.subscribe(self.__onUpdateValue)
         self.__eventWindow = eventWindow
+        self.__dataSeries.requireHistory(eventWindow.windowSize)
+
+    def requireHistory(self, size):
+        # A filter on top of this one needs size values from us, which takes windowSize - 1 more from the source.
+        super().requireHistory(size)
+        self.__dataSeries.requireHistory(size + self.__eventWindow.windowSize - 1)
 
     def __onNewValue(self, sender,dateTime, value):
+        # Filters on top of other filters get None until the source has enough values.
+        if value is None:
+            self.append(dateTime, None)
+            return
         # Let the event window perform calculations.
         self.__eventWindow.onNewValue(dateTime, value)
         # Get the resulting value
@@ -109,7 +187,14 @@ class EventBasedFilter(dataseries.BufferedSequenceDataSeries):
         # Add the new value.
         self.append(dateTime, newValue)
 
+    def __onNewValues(self, sender, dateTimes, values):
+        # Calculate the whole batch at once and pass it on as a single batch.
+        self.extend(dateTimes, self.__eventWindow.computeBatch(dateTimes, values))
+
     def __onUpdateValue(self, sender,dateTime, value):
+        if value is None:
+            self.update(dateTime, None)
+            return
         # Let the event window perform calculations.
         self.__eventWindow.onUpdateValue(dateTime, value)
         # Get the resulting value
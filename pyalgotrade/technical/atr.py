@@ -18,6 +18,9 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import numpy as np
+from scipy import signal
+
 from pyalgotrade import technical
 from pyalgotrade.dataseries import bards
 
@@ -25,47 +28,76 @@ from pyalgotrade.dataseries import bards
 # This event window will calculate and hold true-range values.
 # Formula from http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:average_true_range_atr.
 class ATREventWindow(technical.EventWindow):
-    def __init__(self, period, useAdjustedValues):
+    def __init__(self, period):
         assert(period > 1)
         super(ATREventWindow, self).__init__(period)
-        self.__useAdjustedValues = useAdjustedValues
+        # Previous close and ATR as of the last committed bar. Tentative bars are calculated from them.
         self.__prevClose = None
+        self.__committedValue = None
         self.__value = None
 
     def _calculateTrueRange(self, value):
         ret = None
         if self.__prevClose is None:
-            ret = value.getHigh(self.__useAdjustedValues) - value.getLow(self.__useAdjustedValues)
+            ret = value.high - value.low
         else:
-            tr1 = value.getHigh(self.__useAdjustedValues) - value.getLow(self.__useAdjustedValues)
-            tr2 = abs(value.getHigh(self.__useAdjustedValues) - self.__prevClose)
-            tr3 = abs(value.getLow(self.__useAdjustedValues) - self.__prevClose)
+            tr1 = value.high - value.low
+            tr2 = abs(value.high - self.__prevClose)
+            tr3 = abs(value.low - self.__prevClose)
             ret = max(max(tr1, tr2), tr3)
         return ret
 
+    def __calculate(self, tr):
+        if self.__committedValue is None:
+            return self.data().mean()
+        return (self.__committedValue * (self.windowSize - 1) + tr) / float(self.windowSize)
+
     def onNewValue(self, dateTime, value):
         tr = self._calculateTrueRange(value)
         super(ATREventWindow, self).onNewValue(dateTime, tr)
-        self.__prevClose = value.getClose(self.__useAdjustedValues)
+        self.__prevClose = value.close
+        if self.isFull():
+            self.__value = self.__committedValue = self.__calculate(tr)
 
-        if value is not None and self.isFull():
-            if self.__value is None:
-                self.__value = self.data().mean()
-            else:
-                self.__value = (self.__value * (self.getWindowSize() - 1) + tr) / float(self.getWindowSize())
+    def onUpdateValue(self, dateTime, value):
+        tr = self._calculateTrueRange(value)
+        super(ATREventWindow, self).onUpdateValue(dateTime, tr)
+        if self.isFull():
+            self.__value = self.__calculate(tr)
 
     def calculate(self):
         return self.__value
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        highs = np.array([bar.high for bar in values], dtype=float)
+        lows = np.array([bar.low for bar in values], dtype=float)
+        closes = np.array([bar.close for bar in values], dtype=float)
+        trueRanges = highs - lows
+        prevCloses = closes[:-1]
+        trueRanges[1:] = np.maximum(trueRanges[1:], np.maximum(np.abs(highs[1:] - prevCloses), np.abs(lows[1:] - prevCloses)))
+        # Wilder's smoothing after a first plain average.
+        first = trueRanges[:period].mean()
+        rest, _ = signal.lfilter([1.0 / period], [1, 1.0 / period - 1], trueRanges[period:],
+                                 zi=[(1 - 1.0 / period) * first])
+        ret = np.concatenate(([first], rest))
+        for dateTime, tr in zip(dateTimes[-period:], trueRanges[-period:]):
+            technical.EventWindow.onNewValue(self, dateTime, tr)
+        self.__prevClose = closes[-1]
+        self.__value = self.__committedValue = ret[-1]
+        return technical.batch_values(ret, period - 1)
+
 
 class ATR(technical.EventBasedFilter):
     """Average True Range filter as described in http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:average_true_range_atr
 
-    :param barDataSeries: The BarDataSeries instance being filtered.
-    :type barDataSeries: :class:`pyalgotrade.dataseries.bards.BarDataSeries`.
+    :param barDataSeries: The BufferedBarDataSeries instance being filtered.
+    :type barDataSeries: :class:`pyalgotrade.dataseries.bards.BufferedBarDataSeries`.
     :param period: The average period. Must be > 1.
     :type period: int.
-    :param useAdjustedValues: True to use adjusted Low/High/Close values.
+    :param useAdjustedValues: Not supported, bars are already adjusted when loaded.
     :type useAdjustedValues: boolean.
     :param maxLen: The maximum number of values to hold.
         Once a bounded length is full, when new items are added, a corresponding number of items are discarded from the
@@ -74,7 +106,9 @@ class ATR(technical.EventBasedFilter):
     """
 
     def __init__(self, barDataSeries, period, useAdjustedValues=False, maxLen=None):
-        if not isinstance(barDataSeries, bards.BarDataSeries):
-            raise Exception("barDataSeries must be a dataseries.bards.BarDataSeries instance")
+        if not isinstance(barDataSeries, bards.BufferedBarDataSeries):
+            raise Exception("barDataSeries must be a dataseries.bards.BufferedBarDataSeries instance")
+        if useAdjustedValues:
+            raise Exception("useAdjustedValues is not supported")
 
-        super(ATR, self).__init__(barDataSeries, ATREventWindow(period, useAdjustedValues), maxLen)
+        super(ATR, self).__init__(barDataSeries, ATREventWindow(period), maxLen)
@@ -27,7 +27,7 @@ class BollingerBands(object):
     """Bollinger Bands filter as described in http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:bollinger_bands.
 
     :param dataSeries: The DataSeries instance being filtered.
-    :type dataSeries: :class:`pyalgotrade.dataseries.DataSeries`.
+    :type dataSeries: :class:`pyalgotrade.dataseries.BufferedSequenceDataSeries`.
     :param period: The number of values to use in the calculation. Must be > 1.
     :type period: int.
     :param numStdDev: The number of standard deviations to use for the upper and lower bands.
@@ -41,13 +41,15 @@ class BollingerBands(object):
     def __init__(self, dataSeries, period, numStdDev, maxLen=None):
         self.__sma = ma.SMA(dataSeries, period, maxLen=maxLen)
         self.__stdDev = stats.StdDev(dataSeries, period, maxLen=maxLen)
-        self.__upperBand = dataseries.SequenceDataSeries(maxLen)
-        self.__lowerBand = dataseries.SequenceDataSeries(maxLen)
+        self.__upperBand = dataseries.BufferedSequenceDataSeries()
+        self.__lowerBand = dataseries.BufferedSequenceDataSeries()
         self.__numStdDev = numStdDev
         # It is important to subscribe after sma and stddev since we'll use those values.
-        dataSeries.getNewValueEvent().subscribe(self.__onNewValue)
+        dataSeries.newValueEvent.subscribe(self.__onNewValue)
+        dataSeries.newValuesEvent.subscribe(self.__onNewValues)
+        dataSeries.updateValueEvent.subscribe(self.__onUpdateValue)
 
-    def __onNewValue(self, dataSeries, dateTime, value):
+    def __calculate(self, value):
         upperValue = None
         lowerValue = None
 
@@ -57,9 +59,32 @@ class BollingerBands(object):
                 stdDev = self.__stdDev[-1]
                 upperValue = sma + stdDev * self.__numStdDev
                 lowerValue = sma + stdDev * self.__numStdDev * -1
+        return upperValue, lowerValue
+
+    def __onNewValue(self, dataSeries, dateTime, value):
+        upperValue, lowerValue = self.__calculate(value)
+        self.__upperBand.append(dateTime, upperValue)
+        self.__lowerBand.append(dateTime, lowerValue)
+
+    def __onUpdateValue(self, dataSeries, dateTime, value):
+        upperValue, lowerValue = self.__calculate(value)
+        self.__upperBand.update(dateTime, upperValue)
+        self.__lowerBand.update(dateTime, lowerValue)
 
-        self.__upperBand.appendWithDateTime(dateTime, upperValue)
-        self.__lowerBand.appendWithDateTime(dateTime, lowerValue)
+    def __onNewValues(self, dataSeries, dateTimes, values):
+        # The SMA and StdDev already hold the values for the whole batch.
+        count = len(values)
+        upperValues = []
+        lowerValues = []
+        for value, sma, stdDev in zip(values, self.__sma[-count:], self.__stdDev[-count:]):
+            if value is None or sma is None:
+                upperValues.append(None)
+                lowerValues.append(None)
+            else:
+                upperValues.append(sma + stdDev * self.__numStdDev)
+                lowerValues.append(sma - stdDev * self.__numStdDev)
+        self.__upperBand.extend(dateTimes, upperValues)
+        self.__lowerBand.extend(dateTimes, lowerValues)
 
     def getUpperBand(self):
         """
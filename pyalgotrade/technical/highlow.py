@@ -19,23 +19,38 @@
 """
 
 from pyalgotrade import technical
+from pyalgotrade.utils import collections
 
 
 class HighLowEventWindow(technical.EventWindow):
     def __init__(self, windowSize, useMin):
         super(HighLowEventWindow, self).__init__(windowSize)
         self.__useMin = useMin
+        self.__queue = collections.MonotonicQueue(windowSize, useMin)
+        self.__tentative = None
+
+    def onNewValue(self, dateTime, value):
+        super(HighLowEventWindow, self).onNewValue(dateTime, value)
+        self.__queue.append(value)
+
+    def onUpdateValue(self, dateTime, value):
+        super(HighLowEventWindow, self).onUpdateValue(dateTime, value)
+        self.__tentative = self.__queue.peekWith(value)
 
     def calculate(self):
         ret = None
         if self.isFull():
-            values = self.data()
-            if self.__useMin:
-                ret = values.min()
-            else:
-                ret = values.max()
+            ret = self.__tentative if self.isBuffering() else self.__queue.peek()
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        if len(values) < self.windowSize:
+            return None
+        windows = technical.rolling_window(values, self.windowSize)
+        ret = windows.min(axis=1) if self.__useMin else windows.max(axis=1)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, self.windowSize - 1)
+
 
 class High(technical.EventBasedFilter):
     """This filter calculates the highest value.
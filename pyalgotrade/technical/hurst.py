@@ -44,23 +44,97 @@ def hurst_exp(p, minLags, maxLags):
 
 
 class HurstExponentEventWindow(technical.EventWindow):
+    # Same calculation as hurst_exp, but the sum and sum of squares of the lagged differences are kept per lag.
+    # A new value adds one difference per lag and removes the oldest one, so each value costs O(maxLags).
     def __init__(self, period, minLags, maxLags, logValues=True):
         super(HurstExponentEventWindow, self).__init__(period)
         self.__minLags = minLags
         self.__maxLags = maxLags
         self.__logValues = logValues
+        self.__lags = np.arange(minLags, maxLags)
+        # The slope of a linear fit over log10(lag) is a dot product with these weights.
+        logLagsDev = np.log10(self.__lags) - np.log10(self.__lags).mean()
+        self.__fitWeights = logLagsDev / (logLagsDev ** 2).sum()
+        # Sums over the committed values, and over the window including a tentative value.
+        self.__committed = (np.zeros(len(self.__lags)), np.zeros(len(self.__lags)))
+        self.__current = self.__committed
+        self.__pushes = 0
+
+    def __push(self, value):
+        sums, squares = self.__committed
+        values = self.data()
+        lags = self.__lags
+        dropped = self.droppedValue()
+        if dropped is not None:
+            # The oldest difference for each lag started at the dropped value.
+            diffs = values[lags - 1] - dropped
+            sums = sums - diffs
+            squares = squares - diffs * diffs
+        valid = lags < len(values)
+        diffs = value - values[len(values) - 1 - lags[valid]]
+        sums = sums.copy()
+        squares = squares.copy()
+        sums[valid] += diffs
+        squares[valid] += diffs * diffs
+        return sums, squares
 
     def onNewValue(self, dateTime, value):
         if value is not None and self.__logValues:
             value = np.log10(value)
         super(HurstExponentEventWindow, self).onNewValue(dateTime, value)
+        self.__pushes += 1
+        if self.__pushes >= self.windowSize:
+            # Recompute every period values so that rounding errors do not build up.
+            values = self.data()
+            sums = np.zeros(len(self.__lags))
+            squares = np.zeros(len(self.__lags))
+            for i, lag in enumerate(self.__lags):
+                diffs = values[lag:] - values[:-lag]
+                sums[i] = diffs.sum()
+                squares[i] = (diffs * diffs).sum()
+            self.__committed = (sums, squares)
+            self.__pushes = 0
+        else:
+            self.__committed = self.__push(value)
+        self.__current = self.__committed
+
+    def onUpdateValue(self, dateTime, value):
+        if value is not None and self.__logValues:
+            value = np.log10(value)
+        super(HurstExponentEventWindow, self).onUpdateValue(dateTime, value)
+        self.__current = self.__push(value)
 
     def calculate(self):
         ret = None
         if self.isFull():
-            ret = hurst_exp(self.data(), self.__minLags, self.__maxLags)
+            sums, squares = self.__current
+            counts = self.windowSize - self.__lags
+            means = sums / counts
+            variances = np.maximum(squares / counts - means * means, 0)
+            # tau = sqrt(std) = variance ** 0.25
+            with np.errstate(divide='ignore'):
+                logTau = 0.25 * np.log10(variances)
+            ret = 2 * self.__fitWeights.dot(logTau)
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        p = np.asarray(values, dtype=float)
+        if self.__logValues:
+            p = np.log10(p)
+        # For every lag, the std of the lagged differences inside each window, as in hurst_exp.
+        lags = np.arange(self.__minLags, self.__maxLags)
+        logTau = np.empty((len(lags), len(p) - period + 1))
+        for i, lag in enumerate(lags):
+            diffs = p[lag:] - p[:-lag]
+            logTau[i] = np.log10(np.sqrt(technical.rolling_window(diffs, period - lag).std(axis=1)))
+        # Slope of the linear fit of log10(tau) over log10(lag), for all windows at once.
+        ret = 2 * self.__fitWeights.dot(logTau)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, period - 1)
+
 
 class HurstExponent(technical.EventBasedFilter):
     """Hurst exponent filter.
@@ -71,7 +145,7 @@ class HurstExponent(technical.EventBasedFilter):
     :type period: int.
     :param minLags: The minimum number of lags to use. Must be >= 2.
     :type minLags: int.
-    :param maxLags: The maximum number of lags to use. Must be > minLags.
+    :param maxLags: The maximum number of lags to use. Must be > minLags and < period.
     :type maxLags: int.
     :param maxLen: The maximum number of values to hold.
         Once a bounded length is full, when new items are added, a corresponding number of items are discarded
@@ -83,6 +157,7 @@ class HurstExponent(technical.EventBasedFilter):
         assert period > 0, "period must be > 0"
         assert minLags >= 2, "minLags must be >= 2"
         assert maxLags > minLags, "maxLags must be > minLags"
+        assert maxLags < period, "maxLags must be < period"
 
         super(HurstExponent, self).__init__(
             dataSeries,
@@ -35,25 +35,70 @@ def lsreg(x, y):
     return res[0], res[1]
 
 
+# Regression sums over the window: (n, sum(x), sum(y), sum(x*y), sum(x*x)). x values are relative to an origin
+# that is moved to the first timestamp in the window every time the sums are recomputed, to keep them small.
+def push_sums(sums, x, y, droppedX, droppedY):
+    n, sx, sy, sxy, sxx = sums
+    if droppedX is not None:
+        n -= 1
+        sx -= droppedX
+        sy -= droppedY
+        sxy -= droppedX * droppedY
+        sxx -= droppedX * droppedX
+    return n + 1, sx + x, sy + y, sxy + x * y, sxx + x * x
+
+
 class LeastSquaresRegressionWindow(technical.EventWindow):
     def __init__(self, windowSize):
         assert(windowSize > 1)
         super(LeastSquaresRegressionWindow, self).__init__(windowSize)
-        self.__timestamps = collections.NumPyDeque(windowSize)
+        self.__timestamps = collections.BufferedNumPyDeque(windowSize)
+        self.__origin = None
+        self.__droppedTimestamp = None
+        # Sums over the committed values, and over the window including a tentative value.
+        self.__committed = (0, 0.0, 0.0, 0.0, 0.0)
+        self.__current = self.__committed
+        self.__pushes = 0
 
-    def onNewValue(self, dateTime, value):
-        technical.EventWindow.onNewValue(self, dateTime, value)
-        if value is not None:
-            timestamp = dt.datetime_to_timestamp(dateTime)
+    def __push(self, dateTime, value):
+        timestamp = dt.datetime_to_timestamp(dateTime)
+        if not self.__timestamps.isBuffering():
             if len(self.__timestamps):
                 assert(timestamp > self.__timestamps[-1])
-            self.__timestamps.append(timestamp)
+            self.__droppedTimestamp = self.__timestamps[0] if len(self.__timestamps) == self.windowSize else None
+        if self.__origin is None:
+            self.__origin = timestamp
+        dropped = self.__droppedTimestamp
+        return timestamp, push_sums(self.__committed, timestamp - self.__origin, value,
+                                    None if dropped is None else dropped - self.__origin, self.droppedValue())
+
+    def onNewValue(self, dateTime, value):
+        technical.EventWindow.onNewValue(self, dateTime, value)
+        timestamp, self.__committed = self.__push(dateTime, value)
+        self.__timestamps.append(timestamp)
+        self.__pushes += 1
+        if self.__pushes >= self.windowSize:
+            # Recompute around the first timestamp so that rounding errors do not build up.
+            self.__origin = self.__timestamps[0]
+            x = self.__timestamps.data() - self.__origin
+            y = self.data()
+            self.__committed = (len(x), float(x.sum()), float(y.sum()), float((x * y).sum()), float((x * x).sum()))
+            self.__pushes = 0
+        self.__current = self.__committed
+
+    def onUpdateValue(self, dateTime, value):
+        technical.EventWindow.onUpdateValue(self, dateTime, value)
+        timestamp, self.__current = self.__push(dateTime, value)
+        self.__timestamps.update(timestamp)
 
     def __getValueAtImpl(self, timestamp):
         ret = None
         if self.isFull():
-            a, b = lsreg(self.__timestamps.data(), self.data())
-            ret = a * timestamp + b
+            n, sx, sy, sxy, sxx = self.__current
+            meanX = sx / n
+            meanY = sy / n
+            slope = (sxy - sx * meanY) / (sxx - sx * meanX)
+            ret = meanY + slope * (timestamp - self.__origin - meanX)
         return ret
 
     def getTimeStamps(self):
@@ -68,6 +113,22 @@ class LeastSquaresRegressionWindow(technical.EventWindow):
             ret = self.__getValueAtImpl(self.__timestamps.data()[-1])
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        windowSize = self.windowSize
+        if len(values) < windowSize:
+            return None
+        # Relative to the first timestamp to keep the products small.
+        timestamps = np.array([dt.datetime_to_timestamp(dateTime) for dateTime in dateTimes], dtype=float)
+        x = technical.rolling_window(timestamps - timestamps[0], windowSize)
+        y = technical.rolling_window(values, windowSize)
+        xDev = x - x.mean(axis=1, keepdims=True)
+        yMean = y.mean(axis=1)
+        slopes = (xDev * (y - yMean[:, np.newaxis])).sum(axis=1) / (xDev ** 2).sum(axis=1)
+        # The value of the regression line at the last timestamp of each window.
+        ret = yMean + slopes * xDev[:, -1]
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, windowSize - 1)
+
 
 class LeastSquaresRegression(technical.EventBasedFilter):
     """Calculates values based on a least-squares regression.
@@ -91,21 +152,67 @@ class LeastSquaresRegression(technical.EventBasedFilter):
             Will return None if there are not enough values in the underlying DataSeries.
         :type dateTime: :class:`datetime.datetime`.
         """
-        return self.eventWindow().getValueAt(dateTime)
+        return self.eventWindow.getValueAt(dateTime)
 
 
 class SlopeEventWindow(technical.EventWindow):
+    # With x = 0..windowSize-1 the slope is (sum(x*y) - mean(x) * sum(y)) / sum((x - mean(x))**2), and sliding the
+    # window by one value takes sum(y) off sum(x*y), so both sums are kept up to date in O(1).
     def __init__(self, windowSize):
         super(SlopeEventWindow, self).__init__(windowSize)
         self.__x = np.asarray(list(range(windowSize)))
+        self.__meanX = (windowSize - 1) / 2.0
+        self.__sxx = float(((self.__x - self.__meanX) ** 2).sum())
+        # (sum(y), sum(x*y)) over the committed values, and over the window including a tentative value.
+        self.__committed = (0.0, 0.0)
+        self.__current = self.__committed
+        self.__pushes = 0
+
+    def __push(self, value):
+        sy, sxy = self.__committed
+        dropped = self.droppedValue()
+        if dropped is None:
+            # Still filling up, the value goes at the next x.
+            count = len(self) - 1
+            return sy + value, sxy + count * value
+        sy -= dropped
+        return sy + value, sxy - sy + (self.windowSize - 1) * value
+
+    def onNewValue(self, dateTime, value):
+        super(SlopeEventWindow, self).onNewValue(dateTime, value)
+        self.__pushes += 1
+        if self.__pushes >= self.windowSize:
+            # Recompute every windowSize values so that rounding errors do not build up.
+            y = self.data()
+            self.__committed = (float(y.sum()), float(self.__x[:len(y)].dot(y)))
+            self.__pushes = 0
+        else:
+            self.__committed = self.__push(value)
+        self.__current = self.__committed
+
+    def onUpdateValue(self, dateTime, value):
+        super(SlopeEventWindow, self).onUpdateValue(dateTime, value)
+        self.__current = self.__push(value)
 
     def calculate(self):
         ret = None
         if self.isFull():
-            y = self.data()
-            ret = lsreg(self.__x, y)[0]
+            sy, sxy = self.__current
+            ret = (sxy - self.__meanX * sy) / self.__sxx
         return ret
 
+    def computeSlopes(self, values):
+        # Slope of the regression over x = 0..windowSize-1 for every full window.
+        xDev = self.__x - self.__meanX
+        return technical.rolling_window(values, self.windowSize).dot(xDev) / (xDev ** 2).sum()
+
+    def computeHistory(self, dateTimes, values):
+        if len(values) < self.windowSize:
+            return None
+        ret = self.computeSlopes(values)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, self.windowSize - 1)
+
 
 class Slope(technical.EventBasedFilter):
     """The Slope filter calculates the slope of a least-squares regression line.
@@ -147,6 +254,20 @@ class TrendEventWindow(SlopeEventWindow):
                 ret = None
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        if len(values) < self.windowSize:
+            return None
+        ret = [None] * (self.windowSize - 1)
+        for slope in self.computeSlopes(values).tolist():
+            if slope > self.__positiveThreshold:
+                ret.append(True)
+            elif slope < self.__negativeThreshold:
+                ret.append(False)
+            else:
+                ret.append(None)
+        self.replay(dateTimes, values)
+        return ret
+
 
 class Trend(technical.EventBasedFilter):
     def __init__(self, dataSeries, trendDays, positiveThreshold=0, negativeThreshold=0, maxLen=None):
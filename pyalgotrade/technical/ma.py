@@ -19,6 +19,7 @@
 """
 
 import numpy as np
+from scipy import signal
 from pyalgotrade import technical
 
 
@@ -44,20 +45,45 @@ class SMAEventWindow(technical.EventWindow):
         assert(period > 0)
         super(SMAEventWindow, self).__init__(period)
         self.__value = None
+        # Sum of the committed values in the window, and commits since it was last recomputed from scratch.
+        self.__sum = 0.0
+        self.__pushes = 0
+
+    def __tentativeSum(self, value):
+        dropped = self.droppedValue()
+        return self.__sum + value - (0.0 if dropped is None else dropped)
 
     def onNewValue(self, dateTime, value):
         super().onNewValue(dateTime, value)
+        self.__pushes += 1
+        if self.__pushes >= self.windowSize:
+            # Recompute every period values so that rounding errors do not build up.
+            self.__sum = float(self.data().sum())
+            self.__pushes = 0
+        else:
+            self.__sum = self.__tentativeSum(value)
         if self.isFull():
-            self.__value = self.data().mean()
+            self.__value = self.__sum / self.windowSize
 
     def onUpdateValue(self, dateTime, value):
         super().onUpdateValue(dateTime, value)
+        # The committed sum stays as is, the tentative value only replaces the dropped one.
         if self.isFull():
-            self.__value = self.data().mean()
+            self.__value = self.__tentativeSum(value) / self.windowSize
 
     def calculate(self):
         return self.__value
 
+    def computeHistory(self, dateTimes, values):
+        # Rolling means from a cumulative sum.
+        period = self.windowSize
+        ret = [None] * min(period - 1, len(values))
+        if len(values) >= period:
+            cumsum = np.cumsum(np.insert(np.asarray(values, dtype=float), 0, 0.0))
+            ret.extend(((cumsum[period:] - cumsum[:-period]) / period).tolist())
+        self.replay(dateTimes, values)
+        return ret
+
 
 class SMA(technical.EventBasedFilter):
     """Simple Moving Average filter.
@@ -71,8 +97,8 @@ class SMA(technical.EventBasedFilter):
         opposite end. If None then dataseries.DEFAULT_MAX_LEN is used.
     :type maxLen: int.
     """
-    def __init__(self, dataSeries, period):
-        super(SMA, self).__init__(dataSeries, SMAEventWindow(period))
+    def __init__(self, dataSeries, period, maxLen=None):
+        super(SMA, self).__init__(dataSeries, SMAEventWindow(period), maxLen)
 
 
 class EMAEventWindow(technical.EventWindow):
@@ -81,16 +107,41 @@ class EMAEventWindow(technical.EventWindow):
         super(EMAEventWindow, self).__init__(period)
         self.__multiplier = (2.0 / (period + 1))
         self.__value = None
+        # The EMA as of the last committed value. Tentative values are calculated from it.
+        self.__committedValue = None
+
+    def __calculate(self, value):
+        # Formula from http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:moving_averages
+        if self.__committedValue is None:
+            return self.data().mean()
+        return (value - self.__committedValue) * self.__multiplier + self.__committedValue
 
     def onNewValue(self, dateTime, value):
         super(EMAEventWindow, self).onNewValue(dateTime, value)
+        if value is not None and self.isFull():
+            self.__value = self.__calculate(value)
+            self.__committedValue = self.__value
 
-        # Formula from http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:moving_averages
+    def onUpdateValue(self, dateTime, value):
+        super(EMAEventWindow, self).onUpdateValue(dateTime, value)
         if value is not None and self.isFull():
-            if self.__value is None:
-                self.__value = self.data().mean()
-            else:
-                self.__value = (value - self.__value) * self.__multiplier + self.__value
+            self.__value = self.__calculate(value)
+
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        values = np.asarray(values, dtype=float)
+        # The first value is the SMA of the first period values. The recursion after that is a first order IIR filter.
+        first = values[:period].mean()
+        rest, _ = signal.lfilter([self.__multiplier], [1, self.__multiplier - 1], values[period:],
+                                 zi=[(1 - self.__multiplier) * first])
+        ret = np.concatenate(([first], rest))
+        # Only the last period values and the last EMA are needed to carry on.
+        for dateTime, value in zip(dateTimes[-period:], values[-period:]):
+            technical.EventWindow.onNewValue(self, dateTime, value)
+        self.__value = self.__committedValue = ret[-1]
+        return technical.batch_values(ret, period - 1)
 
     def calculate(self):
         return self.__value
@@ -127,6 +178,14 @@ class WMAEventWindow(technical.EventWindow):
             ret = accum / float(weightSum)
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        ret = technical.rolling_window(values, period).dot(self.__weights) / float(self.__weights.sum())
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, period - 1)
+
 
 class WMA(technical.EventBasedFilter):
     """Weighted Moving Average filter.
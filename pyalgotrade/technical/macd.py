@@ -22,20 +22,18 @@ from pyalgotrade.technical import ma
 from pyalgotrade import dataseries
 
 
-class MACD(dataseries.SequenceDataSeries):
+class MACD(dataseries.BufferedSequenceDataSeries):
     """Moving Average Convergence-Divergence indicator as described in http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:moving_average_convergence_divergence_macd.
 
     :param dataSeries: The DataSeries instance being filtered.
-    :type dataSeries: :class:`pyalgotrade.dataseries.DataSeries`.
+    :type dataSeries: :class:`pyalgotrade.dataseries.BufferedSequenceDataSeries`.
     :param fastEMA: The number of values to use to calculate the fast EMA.
     :type fastEMA: int.
     :param slowEMA: The number of values to use to calculate the slow EMA.
     :type slowEMA: int.
     :param signalEMA: The number of values to use to calculate the signal EMA.
     :type signalEMA: int.
-    :param maxLen: The maximum number of values to hold.
-        Once a bounded length is full, when new items are added, a corresponding number of items are discarded from the
-        opposite end. If None then dataseries.DEFAULT_MAX_LEN is used.
+    :param maxLen: Not used, kept for compatibility.
     :type maxLen: int.
     """
     def __init__(self, dataSeries, fastEMA, slowEMA, signalEMA, maxLen=None):
@@ -44,53 +42,109 @@ class MACD(dataseries.SequenceDataSeries):
         assert(fastEMA < slowEMA)
         assert(signalEMA > 0)
 
-        super(MACD, self).__init__(maxLen)
+        super(MACD, self).__init__()
 
         # We need to skip some values when calculating the fast EMA in order for both EMA
         # to calculate their first values at the same time.
         # I'M FORCING THIS BEHAVIOUR ONLY TO MAKE THIS FITLER MATCH TA-Lib MACD VALUES.
         self.__fastEMASkip = slowEMA - fastEMA
+        # Nothing fed yet, so a batch can be calculated vectorised by the EMA windows.
+        self.__empty = True
 
         self.__fastEMAWindow = ma.EMAEventWindow(fastEMA)
         self.__slowEMAWindow = ma.EMAEventWindow(slowEMA)
         self.__signalEMAWindow = ma.EMAEventWindow(signalEMA)
-        self.__signal = dataseries.SequenceDataSeries(maxLen)
-        self.__histogram = dataseries.SequenceDataSeries(maxLen)
-        dataSeries.getNewValueEvent().subscribe(self.__onNewValue)
+        self.__signal = dataseries.BufferedSequenceDataSeries()
+        self.__histogram = dataseries.BufferedSequenceDataSeries()
+        dataSeries.newValueEvent.subscribe(self.__onNewValue)
+        dataSeries.newValuesEvent.subscribe(self.__onNewValues)
+        dataSeries.updateValueEvent.subscribe(self.__onUpdateValue)
+        dataSeries.requireHistory(slowEMA + signalEMA - 1)
 
     def getSignal(self):
-        """Returns a :class:`pyalgotrade.dataseries.DataSeries` with the EMA over the MACD."""
+        """Returns a :class:`pyalgotrade.dataseries.BufferedSequenceDataSeries` with the EMA over the MACD."""
         return self.__signal
 
     def getHistogram(self):
-        """Returns a :class:`pyalgotrade.dataseries.DataSeries` with the histogram (the difference between the MACD and the Signal)."""
+        """Returns a :class:`pyalgotrade.dataseries.BufferedSequenceDataSeries` with the histogram (the difference between the MACD and the Signal)."""
         return self.__histogram
 
-    def __onNewValue(self, dataSeries, dateTime, value):
+    def __calculate(self, dateTime, value, update):
+        # The EMA windows keep their committed state, so a tentative value does not disturb the next committed one.
         diff = None
         macdValue = None
         signalValue = None
         histogramValue = None
+        if value is None:
+            return macdValue, signalValue, histogramValue
 
         # We need to skip some values when calculating the fast EMA in order for both EMA
         # to calculate their first values at the same time.
         # I'M FORCING THIS BEHAVIOUR ONLY TO MAKE THIS FITLER MATCH TA-Lib MACD VALUES.
-        self.__slowEMAWindow.onNewValue(dateTime, value)
+        if update:
+            self.__slowEMAWindow.onUpdateValue(dateTime, value)
+        else:
+            self.__slowEMAWindow.onNewValue(dateTime, value)
         if self.__fastEMASkip > 0:
-            self.__fastEMASkip -= 1
+            if not update:
+                self.__fastEMASkip -= 1
         else:
-            self.__fastEMAWindow.onNewValue(dateTime, value)
+            if update:
+                self.__fastEMAWindow.onUpdateValue(dateTime, value)
+            else:
+                self.__fastEMAWindow.onNewValue(dateTime, value)
             if self.__fastEMAWindow.isFull():
                 diff = self.__fastEMAWindow.calculate() - self.__slowEMAWindow.calculate()
 
         # Make the first MACD value available as soon as the first signal value is available.
         # I'M FORCING THIS BEHAVIOUR ONLY TO MAKE THIS FITLER MATCH TA-Lib MACD VALUES.
-        self.__signalEMAWindow.onNewValue(dateTime, diff)
-        if self.__signalEMAWindow.isFull():
-            macdValue = diff
-            signalValue = self.__signalEMAWindow.calculate()
-            histogramValue = macdValue - signalValue
-
-        self.appendWithDateTime(dateTime, macdValue)
-        self.__signal.appendWithDateTime(dateTime, signalValue)
-        self.__histogram.appendWithDateTime(dateTime, histogramValue)
+        # The signal EMA only sees the values where there is a difference.
+        if diff is not None:
+            if update:
+                self.__signalEMAWindow.onUpdateValue(dateTime, diff)
+            else:
+                self.__signalEMAWindow.onNewValue(dateTime, diff)
+            if self.__signalEMAWindow.isFull():
+                macdValue = diff
+                signalValue = self.__signalEMAWindow.calculate()
+                histogramValue = macdValue - signalValue
+        return macdValue, signalValue, histogramValue
+
+    def __onNewValue(self, dataSeries, dateTime, value):
+        self.__empty = False
+        macdValue, signalValue, histogramValue = self.__calculate(dateTime, value, False)
+        self.append(dateTime, macdValue)
+        self.__signal.append(dateTime, signalValue)
+        self.__histogram.append(dateTime, histogramValue)
+
+    def __onUpdateValue(self, dataSeries, dateTime, value):
+        self.__empty = False
+        macdValue, signalValue, histogramValue = self.__calculate(dateTime, value, True)
+        self.update(dateTime, macdValue)
+        self.__signal.update(dateTime, signalValue)
+        self.__histogram.update(dateTime, histogramValue)
+
+    def __computeHistory(self, dateTimes, values):
+        # Same as feeding the values one by one, but each EMA window does its part vectorised.
+        count = len(values)
+        skip = self.__fastEMASkip
+        slowValues = self.__slowEMAWindow.computeBatch(dateTimes, values)
+        fastValues = [None] * min(skip, count) + self.__fastEMAWindow.computeBatch(dateTimes[skip:], values[skip:])
+        self.__fastEMASkip = max(skip - count, 0)
+        diffs = [None if fast is None else fast - slow for fast, slow in zip(fastValues, slowValues)]
+        first = next((i for i, diff in enumerate(diffs) if diff is not None), count)
+        signalValues = [None] * first + self.__signalEMAWindow.computeBatch(dateTimes[first:], diffs[first:])
+        macdValues = [None if signal is None else diff for diff, signal in zip(diffs, signalValues)]
+        histogramValues = [None if signal is None else diff - signal for diff, signal in zip(diffs, signalValues)]
+        return macdValues, signalValues, histogramValues
+
+    def __onNewValues(self, dataSeries, dateTimes, values):
+        if self.__empty and all(value is not None for value in values):
+            macdValues, signalValues, histogramValues = self.__computeHistory(dateTimes, values)
+        else:
+            results = [self.__calculate(dateTime, value, False) for dateTime, value in zip(dateTimes, values)]
+            macdValues, signalValues, histogramValues = [list(result) for result in zip(*results)] if len(results) else ([], [], [])
+        self.__empty = False
+        self.extend(dateTimes, macdValues)
+        self.__signal.extend(dateTimes, signalValues)
+        self.__histogram.extend(dateTimes, histogramValues)
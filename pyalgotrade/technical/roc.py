@@ -18,6 +18,8 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import numpy as np
+
 from pyalgotrade import technical
 
 
@@ -38,6 +40,21 @@ class ROCEventWindow(technical.EventWindow):
                     ret = diff / prev
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        valuesAgo = self.windowSize - 1
+        if len(values) <= valuesAgo:
+            return None
+        values = np.asarray(values, dtype=float)
+        prev = values[:-valuesAgo]
+        diff = values[valuesAgo:] - prev
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(diff == 0, 0.0, diff / prev)
+        # No rate of change from a zero value.
+        ret = [None] * valuesAgo + [None if p == 0 and d != 0 else r
+                                    for p, d, r in zip(prev.tolist(), diff.tolist(), rates.tolist())]
+        self.replay(dateTimes, values)
+        return ret
+
 
 class RateOfChange(technical.EventBasedFilter):
     """Rate of change filter as described in http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:rate_of_change_roc_and_momentum.
@@ -18,6 +18,9 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import numpy as np
+from scipy import signal
+
 from pyalgotrade import technical
 
 
@@ -94,31 +97,62 @@ class RSIEventWindow(technical.EventWindow):
         self.__prevLoss = None
         self.__period = period
 
+    # Returns the average gain and loss for the last value in the window. __prevGain and __prevLoss only change when
+    # a value is committed, so tentative values from onUpdateValue are calculated from the committed averages.
+    def __calculate(self):
+        # Formula from http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:relative_strength_index_rsi
+        if self.__prevGain is None:
+            assert(self.__prevLoss is None)
+            avgGain, avgLoss = avg_gain_loss(self.data(), 0, len(self.data()))
+        else:
+            # Rest of averages are smoothed
+            assert(self.__prevLoss is not None)
+            prevValue = self.data()[-2]
+            currValue = self.data()[-1]
+            currGain, currLoss = gain_loss_one(prevValue, currValue)
+            avgGain = (self.__prevGain * (self.__period-1) + currGain) / float(self.__period)
+            avgLoss = (self.__prevLoss * (self.__period-1) + currLoss) / float(self.__period)
+
+        if avgLoss == 0:
+            self.__value = 100
+        else:
+            rs = avgGain / avgLoss
+            self.__value = 100 - 100 / (1 + rs)
+        return avgGain, avgLoss
+
     def onNewValue(self, dateTime, value):
         super(RSIEventWindow, self).onNewValue(dateTime, value)
+        if value is not None and self.isFull():
+            self.__prevGain, self.__prevLoss = self.__calculate()
 
-        # Formula from http://stockcharts.com/school/doku.php?id=chart_school:technical_indicators:relative_strength_index_rsi
+    def onUpdateValue(self, dateTime, value):
+        super(RSIEventWindow, self).onUpdateValue(dateTime, value)
         if value is not None and self.isFull():
-            if self.__prevGain is None:
-                assert(self.__prevLoss is None)
-                avgGain, avgLoss = avg_gain_loss(self.data(), 0, len(self.data()))
-            else:
-                # Rest of averages are smoothed
-                assert(self.__prevLoss is not None)
-                prevValue = self.data()[-2]
-                currValue = self.data()[-1]
-                currGain, currLoss = gain_loss_one(prevValue, currValue)
-                avgGain = (self.__prevGain * (self.__period-1) + currGain) / float(self.__period)
-                avgLoss = (self.__prevLoss * (self.__period-1) + currLoss) / float(self.__period)
-
-            if avgLoss == 0:
-                self.__value = 100
-            else:
-                rs = avgGain / avgLoss
-                self.__value = 100 - 100 / (1 + rs)
-
-            self.__prevGain = avgGain
-            self.__prevLoss = avgLoss
+            self.__calculate()
+
+    def computeHistory(self, dateTimes, values):
+        period = self.__period
+        if len(values) < period + 1:
+            return None
+        changes = np.diff(np.asarray(values, dtype=float))
+        gains = np.where(changes > 0, changes, 0.0)
+        losses = np.where(changes < 0, -changes, 0.0)
+        # The first averages are plain means, the rest are smoothed: avg = (prevAvg * (period - 1) + curr) / period.
+        smoothing = [1.0 / period], [1, 1.0 / period - 1]
+        averages = []
+        for amounts in (gains, losses):
+            first = amounts[:period].mean()
+            rest, _ = signal.lfilter(*smoothing, amounts[period:], zi=[(1 - 1.0 / period) * first])
+            averages.append(np.concatenate(([first], rest)))
+        avgGains, avgLosses = averages
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(avgLosses == 0, 100, 100 - 100 / (1 + avgGains / avgLosses))
+        for dateTime, value in zip(dateTimes[-period - 1:], values[-period - 1:]):
+            technical.EventWindow.onNewValue(self, dateTime, value)
+        self.__prevGain = avgGains[-1]
+        self.__prevLoss = avgLosses[-1]
+        self.__value = ret[-1]
+        return technical.batch_values(ret, period)
 
     def calculate(self):
         return self.__value
@@ -19,18 +19,87 @@
 """
 
 from pyalgotrade import technical
+import math
+import numpy as np
+
+
+# Welford's running mean and sum of squared deviations (M2), extended to sliding windows: a value entering a full
+# window replaces the one leaving it.
+def welford_push(count, mean, m2, value, dropped):
+    if dropped is None:
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+    else:
+        delta = value - dropped
+        newMean = mean + delta / count
+        m2 += delta * (value - newMean + dropped - mean)
+        mean = newMean
+    return count, mean, max(m2, 0.0)
+
+
+class WelfordEventWindow(technical.EventWindow):
+    """An EventWindow that keeps the mean and variance of its values up to date in O(1) per value, including
+    tentative values from onUpdateValue.
+
+    .. note::
+        This is a base class and should not be used directly.
+    """
+
+    def __init__(self, period, ddof):
+        super(WelfordEventWindow, self).__init__(period)
+        self.__ddof = ddof
+        # Statistics over the committed values. The ones over the window including a tentative value are kept apart.
+        self.__committed = (0, 0.0, 0.0)
+        self.__current = self.__committed
+        self.__pushes = 0
+
+    def onNewValue(self, dateTime, value):
+        super(WelfordEventWindow, self).onNewValue(dateTime, value)
+        self.__pushes += 1
+        if self.__pushes >= self.windowSize:
+            # Recompute every period values so that rounding errors do not build up.
+            values = self.data()
+            mean = float(values.mean())
+            self.__committed = (len(values), mean, float(((values - mean) ** 2).sum()))
+            self.__pushes = 0
+        else:
+            self.__committed = welford_push(*self.__committed, value, self.droppedValue())
+        self.__current = self.__committed
+
+    def onUpdateValue(self, dateTime, value):
+        super(WelfordEventWindow, self).onUpdateValue(dateTime, value)
+        self.__current = welford_push(*self.__committed, value, self.droppedValue())
 
+    def getMean(self):
+        return self.__current[1]
 
-class StdDevEventWindow(technical.EventWindow):
+    def getStdDev(self):
+        count, mean, m2 = self.__current
+        if count <= self.__ddof:
+            return float('nan')
+        return math.sqrt(m2 / (count - self.__ddof))
+
+
+class StdDevEventWindow(WelfordEventWindow):
     def __init__(self, period, ddof):
         assert(period > 0)
-        super(StdDevEventWindow, self).__init__(period)
+        super(StdDevEventWindow, self).__init__(period, ddof)
         self.__ddof = ddof
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        ret = technical.rolling_window(values, period).std(axis=1, ddof=self.__ddof)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, period - 1)
+
     def calculate(self):
         ret = None
         if self.isFull():
-            ret = self.data().std(ddof=self.__ddof)
+            ret = self.getStdDev()
         return ret
 
 
@@ -53,20 +122,27 @@ class StdDev(technical.EventBasedFilter):
         super(StdDev, self).__init__(dataSeries, StdDevEventWindow(period, ddof), maxLen)
 
 
-class ZScoreEventWindow(technical.EventWindow):
+class ZScoreEventWindow(WelfordEventWindow):
     def __init__(self, period, ddof):
         assert(period > 1)
-        super(ZScoreEventWindow, self).__init__(period)
+        super(ZScoreEventWindow, self).__init__(period, ddof)
         self.__ddof = ddof
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        windows = technical.rolling_window(values, period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = (windows[:, -1] - windows.mean(axis=1)) / windows.std(axis=1, ddof=self.__ddof)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, period - 1)
+
     def calculate(self):
         ret = None
         if self.isFull():
-            values = self.data()
-            lastValue = values[-1]
-            mean = values.mean()
-            std = values.std(ddof=self.__ddof)
-            ret = (lastValue - mean) / float(std)
+            lastValue = self.data()[-1]
+            ret = (lastValue - self.getMean()) / float(self.getStdDev())
         return ret
 
 
@@ -18,33 +18,49 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import numpy as np
+
 from pyalgotrade import technical
 from pyalgotrade.dataseries import bards
 from pyalgotrade.technical import ma
+from pyalgotrade.utils import collections
 
 
-def get_low_high_values(useAdjusted, bars):
+def get_low_high_values(bars):
     currBar = bars[0]
-    lowestLow = currBar.getLow(useAdjusted)
-    highestHigh = currBar.getHigh(useAdjusted)
+    lowestLow = currBar.low
+    highestHigh = currBar.high
     for i in range(len(bars)):
         currBar = bars[i]
-        lowestLow = min(lowestLow, currBar.getLow(useAdjusted))
-        highestHigh = max(highestHigh, currBar.getHigh(useAdjusted))
+        lowestLow = min(lowestLow, currBar.low)
+        highestHigh = max(highestHigh, currBar.high)
     return (lowestLow, highestHigh)
 
 
 class SOEventWindow(technical.EventWindow):
-    def __init__(self, period, useAdjustedValues):
+    def __init__(self, period):
         assert(period > 1)
         super(SOEventWindow, self).__init__(period, dtype=object)
-        self.__useAdjusted = useAdjustedValues
+        # Rolling lowest low and highest high. Tentative bars are combined with the committed ones in calculate.
+        self.__lows = collections.MonotonicQueue(period, True)
+        self.__highs = collections.MonotonicQueue(period, False)
+
+    def onNewValue(self, dateTime, value):
+        super(SOEventWindow, self).onNewValue(dateTime, value)
+        self.__lows.append(value.low)
+        self.__highs.append(value.high)
 
     def calculate(self):
         ret = None
         if self.isFull():
-            lowestLow, highestHigh = get_low_high_values(self.__useAdjusted, self.data())
-            currentClose = self.data()[-1].getClose(self.__useAdjusted)
+            currentBar = self.data()[-1]
+            if self.isBuffering():
+                lowestLow = self.__lows.peekWith(currentBar.low)
+                highestHigh = self.__highs.peekWith(currentBar.high)
+            else:
+                lowestLow = self.__lows.peek()
+                highestHigh = self.__highs.peek()
+            currentClose = currentBar.close
             closeDelta = currentClose - lowestLow
             if closeDelta:
                 ret = closeDelta / float(highestHigh - lowestLow) * 100
@@ -52,19 +68,31 @@ class SOEventWindow(technical.EventWindow):
                 ret = 0.0
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        period = self.windowSize
+        if len(values) < period:
+            return None
+        lowestLows = technical.rolling_window([bar.low for bar in values], period).min(axis=1)
+        highestHighs = technical.rolling_window([bar.high for bar in values], period).max(axis=1)
+        closeDeltas = np.array([bar.close for bar in values[period - 1:]], dtype=float) - lowestLows
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(closeDeltas != 0, closeDeltas / (highestHighs - lowestLows) * 100, 0.0)
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, period - 1)
+
 
 class StochasticOscillator(technical.EventBasedFilter):
     """Fast Stochastic Oscillator filter as described in
     http://stockcharts.com/school/doku.php?st=stochastic+oscillator&id=chart_school:technical_indicators:stochastic_oscillator_fast_slow_and_full.
     Note that the value returned by this filter is %K. To access %D use :meth:`getD`.
 
-    :param barDataSeries: The BarDataSeries instance being filtered.
-    :type barDataSeries: :class:`pyalgotrade.dataseries.bards.BarDataSeries`.
+    :param barDataSeries: The BufferedBarDataSeries instance being filtered.
+    :type barDataSeries: :class:`pyalgotrade.dataseries.bards.BufferedBarDataSeries`.
     :param period: The period. Must be > 1.
     :type period: int.
     :param dSMAPeriod: The %D SMA period. Must be > 1.
     :type dSMAPeriod: int.
-    :param useAdjustedValues: True to use adjusted Low/High/Close values.
+    :param useAdjustedValues: Not supported, bars are already adjusted when loaded.
     :type useAdjustedValues: boolean.
     :param maxLen: The maximum number of values to hold.
         Once a bounded length is full, when new items are added, a corresponding number of items are discarded from the
@@ -74,11 +102,12 @@ class StochasticOscillator(technical.EventBasedFilter):
 
     def __init__(self, barDataSeries, period, dSMAPeriod=3, useAdjustedValues=False, maxLen=None):
         assert dSMAPeriod > 1, "dSMAPeriod must be > 1"
-        assert isinstance(barDataSeries, bards.BarDataSeries), \
-            "barDataSeries must be a dataseries.bards.BarDataSeries instance"
+        assert not useAdjustedValues, "useAdjustedValues is not supported"
+        assert isinstance(barDataSeries, bards.BufferedBarDataSeries), \
+            "barDataSeries must be a dataseries.bards.BufferedBarDataSeries instance"
 
-        super(StochasticOscillator, self).__init__(barDataSeries, SOEventWindow(period, useAdjustedValues), maxLen)
-        self.__d = ma.SMA(self, dSMAPeriod, maxLen)
+        super(StochasticOscillator, self).__init__(barDataSeries, SOEventWindow(period), maxLen)
+        self.__d = ma.SMA(self, dSMAPeriod)
 
     def getD(self):
         """Returns a :class:`pyalgotrade.dataseries.DataSeries` with the %D values."""
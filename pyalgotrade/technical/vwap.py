@@ -18,10 +18,18 @@
 .. moduleauthor:: Gabriel Martin Becedillas Ruiz <gabriel.becedillas@gmail.com>
 """
 
+import numpy as np
+
 from pyalgotrade import technical
 from pyalgotrade.dataseries import bards
 
 
+def get_price(bar, useTypicalPrice):
+    if useTypicalPrice:
+        return (bar.high + bar.low + bar.close) / 3.0
+    return bar.close
+
+
 class VWAPEventWindow(technical.EventWindow):
     def __init__(self, windowSize, useTypicalPrice):
         super(VWAPEventWindow, self).__init__(windowSize, dtype=object)
@@ -34,21 +42,31 @@ class VWAPEventWindow(technical.EventWindow):
             cumVolume = 0
 
             for bar in self.data():
-                if self.__useTypicalPrice:
-                    cumTotal += bar.getTypicalPrice() * bar.getVolume()
-                else:
-                    cumTotal += bar.getPrice() * bar.getVolume()
-                cumVolume += bar.getVolume()
+                cumTotal += get_price(bar, self.__useTypicalPrice) * bar.volume
+                cumVolume += bar.volume
 
             ret = cumTotal / float(cumVolume)
         return ret
 
+    def computeHistory(self, dateTimes, values):
+        windowSize = self.windowSize
+        if len(values) < windowSize:
+            return None
+        prices = np.array([get_price(bar, self.__useTypicalPrice) for bar in values], dtype=float)
+        volumes = np.array([bar.volume for bar in values], dtype=float)
+        # Rolling sums from cumulative sums.
+        cumTotal = np.cumsum(np.insert(prices * volumes, 0, 0.0))
+        cumVolume = np.cumsum(np.insert(volumes, 0, 0.0))
+        ret = (cumTotal[windowSize:] - cumTotal[:-windowSize]) / (cumVolume[windowSize:] - cumVolume[:-windowSize])
+        self.replay(dateTimes, values)
+        return technical.batch_values(ret, windowSize - 1)
+
 
 class VWAP(technical.EventBasedFilter):
     """Volume Weighted Average Price filter.
 
     :param dataSeries: The DataSeries instance being filtered.
-    :type dataSeries: :class:`pyalgotrade.dataseries.bards.BarDataSeries`.
+    :type dataSeries: :class:`pyalgotrade.dataseries.bards.BufferedBarDataSeries`.
     :param period: The number of values to use to calculate the VWAP.
     :type period: int.
     :param useTypicalPrice: True if the typical price should be used instead of the closing price.
@@ -60,10 +78,10 @@ class VWAP(technical.EventBasedFilter):
     """
 
     def __init__(self, dataSeries, period, useTypicalPrice=False, maxLen=None):
-        assert isinstance(dataSeries, bards.BarDataSeries), \
-            "dataSeries must be a dataseries.bards.BarDataSeries instance"
+        assert isinstance(dataSeries, bards.BufferedBarDataSeries), \
+            "dataSeries must be a dataseries.bards.BufferedBarDataSeries instance"
 
         super(VWAP, self).__init__(dataSeries, VWAPEventWindow(period, useTypicalPrice), maxLen)
 
     def getPeriod(self):
-        return self.getWindowSize()
+        return self.eventWindow.windowSize
@@ -23,6 +23,7 @@ import threading
 import json
 
 from pyalgotrade import observer
+from pyalgotrade import asyncdispatcher
 import pyalgotrade.logger
 
 import tweepy
@@ -95,6 +96,8 @@ class TwitterFeed(observer.Subject):
         self.__queue = queue.Queue()
         self.__thread = None
         self.__running = False
+        # A tweet taken from the queue by nextEvent.
+        self.__pendingData = None
 
         listener = Listener(self.__queue)
         auth = tweepy.OAuthHandler(consumerKey, consumerSecret)
@@ -115,7 +118,12 @@ class TwitterFeed(observer.Subject):
     def __dispatchImpl(self):
         ret = False
         try:
-            nextTweet = json.loads(self.__queue.get(True, TwitterFeed.QUEUE_TIMEOUT))
+            if self.__pendingData is not None:
+                data = self.__pendingData
+                self.__pendingData = None
+            else:
+                data = self.__queue.get(True, TwitterFeed.QUEUE_TIMEOUT)
+            nextTweet = json.loads(data)
             ret = True
             self.__event.emit(nextTweet)
         except queue.Empty:
@@ -154,6 +162,11 @@ class TwitterFeed(observer.Subject):
     def eof(self):
         return not self.__running
 
+    async def nextEvent(self):
+        # Used by asyncdispatcher.AsyncDispatcher. The tweet taken from the queue is handled by the next dispatch.
+        if self.__pendingData is None:
+            self.__pendingData = await asyncdispatcher.get_from_queue(self.__queue, self.eof)
+
     def dispatch(self):
         ret = False
         dispatched = TwitterFeed.MAX_EVENTS_PER_DISPATCH
@@ -19,6 +19,7 @@
 """
 
 import numpy as np
+from collections import deque
 
 
 def lt(v1, v2):
@@ -57,50 +58,50 @@ def intersect(values1, values2, skipNone=False):
 
 
 # Like a collections.deque but using a numpy.array.
+# Values live in a backing array twice as big as maxLen. The window is the contiguous slice [start, end), so appends
+# only move the end (and the start once full). When the end reaches the end of the backing array the window is copied
+# back to the front, once every maxLen appends, which keeps appends amortized O(1) and data() a view that never wraps.
 class NumPyDeque(object):
     def __init__(self, maxLen, dtype=float):
         assert maxLen > 0, "Invalid maximum length"
 
-        self.__values = np.empty(maxLen, dtype=dtype)
+        self.__values = np.empty(2 * maxLen, dtype=dtype)
         self.__maxLen = maxLen
-        self.__nextPos = 0
+        self.__start = 0
+        self.__end = 0
 
     def getMaxLen(self):
         return self.__maxLen
 
     def append(self, value):
-        if self.__nextPos < self.__maxLen:
-            self.__values[self.__nextPos] = value
-            self.__nextPos += 1
-        else:
-            # Shift items to the left and put the last value.
-            # I'm not using np.roll to avoid creating a new array.
-            self.__values[0:-1] = self.__values[1:]
-            self.__values[self.__nextPos - 1] = value
+        if self.__end == len(self.__values):
+            # The window is at most maxLen long and starts at or after maxLen, so the copy never overlaps.
+            size = self.__end - self.__start
+            self.__values[0:size] = self.__values[self.__start:self.__end]
+            self.__start = 0
+            self.__end = size
+        self.__values[self.__end] = value
+        self.__end += 1
+        if self.__end - self.__start > self.__maxLen:
+            self.__start += 1
 
     def data(self):
-        # If all values are not initialized, return a portion of the array.
-        if self.__nextPos < self.__maxLen:
-            ret = self.__values[0:self.__nextPos]
-        else:
-            ret = self.__values
-        return ret
+        return self.__values[self.__start:self.__end]
 
     def resize(self, maxLen):
         assert maxLen > 0, "Invalid maximum length"
 
         # Create empty, copy last values and swap.
-        values = np.empty(maxLen, dtype=self.__values.dtype)
-        lastValues = self.__values[0:self.__nextPos]
-        values[0:min(maxLen, len(lastValues))] = lastValues[-1*min(maxLen, len(lastValues)):]
+        values = np.empty(2 * maxLen, dtype=self.__values.dtype)
+        lastValues = self.data()[-1*maxLen:]
+        values[0:len(lastValues)] = lastValues
         self.__values = values
-
         self.__maxLen = maxLen
-        if self.__nextPos >= self.__maxLen:
-            self.__nextPos = self.__maxLen
+        self.__start = 0
+        self.__end = len(lastValues)
 
     def __len__(self):
-        return self.__nextPos
+        return self.__end - self.__start
 
     def __getitem__(self, key):
         return self.data()[key]
@@ -109,11 +110,14 @@ class NumPyDeque(object):
 # I'm not using collections.deque because:
 # 1: Random access is slower.
 # 2: Slicing is not supported.
+# Once full, values are not popped from the front one at a time (that shifts the whole list on every append). The
+# window starts at an offset instead, and the discarded prefix is deleted in one go when it grows to maxLen.
 class ListDeque(object):
     def __init__(self, maxLen):
         assert maxLen > 0, "Invalid maximum length"
 
         self.__values = []
+        self.__start = 0
         self.__maxLen = maxLen
 
     def getMaxLen(self):
@@ -122,23 +126,90 @@ class ListDeque(object):
     def append(self, value):
         self.__values.append(value)
         # Check bounds
-        if len(self.__values) > self.__maxLen:
-            self.__values.pop(0)
+        if len(self.__values) - self.__start > self.__maxLen:
+            self.__start += 1
+            if self.__start >= self.__maxLen:
+                self.__compact()
+
+    def __compact(self):
+        del self.__values[:self.__start]
+        self.__start = 0
 
     def data(self):
-        return self.__values
+        if self.__start == 0:
+            return self.__values
+        # Compacting on every call would cost O(n) per call, so only do it once the discarded prefix is bigger than
+        # the window.
+        if self.__start > len(self.__values) - self.__start:
+            self.__compact()
+            return self.__values
+        return self.__values[self.__start:]
 
     def resize(self, maxLen):
         assert maxLen > 0, "Invalid maximum length"
 
         self.__maxLen = maxLen
-        self.__values = self.__values[-1*maxLen:]
+        self.__values = self.__values[self.__start:][-1*maxLen:]
+        self.__start = 0
 
     def __len__(self):
-        return len(self.__values)
+        return len(self.__values) - self.__start
 
     def __getitem__(self, key):
-        return self.__values[key]
+        if isinstance(key, int):
+            size = len(self.__values) - self.__start
+            if key < 0:
+                key += size
+            if key < 0 or key >= size:
+                raise IndexError("ListDeque index out of range")
+            return self.__values[self.__start + key]
+        elif isinstance(key, slice) and (key.step is None or key.step > 0):
+            begin, end, step = key.indices(len(self.__values) - self.__start)
+            return self.__values[self.__start + begin:self.__start + end:step]
+        return self.data()[key]
+
+
+# Rolling minimum or maximum over the last windowSize committed values in amortized O(1) per append.
+# The queue holds (position, value) pairs with values strictly improving from back to front, so the front is always the
+# extreme of the window. A tentative value is not pushed at all. peekWith combines it with the last windowSize - 1
+# committed values instead, which at most means skipping the front entry.
+class MonotonicQueue(object):
+    def __init__(self, windowSize, useMin):
+        assert windowSize > 0, "Invalid window size"
+
+        self.__windowSize = windowSize
+        self.__useMin = useMin
+        self.__entries = deque()
+        self.__count = 0
+
+    def __len__(self):
+        return min(self.__count, self.__windowSize)
+
+    def __dominates(self, v1, v2):
+        return v1 <= v2 if self.__useMin else v1 >= v2
+
+    def append(self, value):
+        entries = self.__entries
+        while entries and self.__dominates(value, entries[-1][1]):
+            entries.pop()
+        entries.append((self.__count, value))
+        self.__count += 1
+        if entries[0][0] <= self.__count - 1 - self.__windowSize:
+            entries.popleft()
+
+    def peek(self):
+        """Returns the extreme of the last windowSize committed values, or None if there are none."""
+        return self.__entries[0][1] if self.__entries else None
+
+    def peekWith(self, value):
+        """Returns the extreme of the last windowSize - 1 committed values plus value."""
+        entries = self.__entries
+        first = 0
+        if entries and entries[0][0] <= self.__count - self.__windowSize:
+            first = 1
+        if first < len(entries) and not self.__dominates(value, entries[first][1]):
+            return entries[first][1]
+        return value
 
 
 class BufferedList:
@@ -175,27 +246,165 @@ class BufferedList:
         else:
             self.__values[-1] = value
 
+    def extend(self, values):
+        assert not self.__buffering, "can not extend while buffering"
+        self.__values.extend(values)
+
+    def prepend(self, values):
+        self.__values[0:0] = values
+
+
+class BufferedNumPyList:
+    """Like BufferedList but backed by a growable numpy array. Slices are views of the array, not copies."""
+
+    def __init__(self, dtype=float, capacity=16):
+        assert capacity > 0, "Invalid capacity"
+        self.__values = np.empty(capacity, dtype=dtype)
+        self.__size = 0
+        self.__buffering = False
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        return iter(self.data())
+
+    def __getitem__(self, item):
+        return self.data()[item]
+
+    def __str__(self):
+        return str(self.data())
+
+    def data(self):
+        # A view of the initialized portion. It is invalidated when the array grows.
+        return self.__values[:self.__size]
+
+    def isBuffering(self):
+        return self.__buffering
+
+    def __reserve(self, size):
+        if size > len(self.__values):
+            # Double the capacity so that appends are amortized O(1).
+            values = np.empty(max(size, 2 * len(self.__values)), dtype=self.__values.dtype)
+            values[:self.__size] = self.__values[:self.__size]
+            self.__values = values
+
+    def append(self, value):
+        if self.__buffering:
+            self.__values[self.__size - 1] = value
+        else:
+            self.__reserve(self.__size + 1)
+            self.__values[self.__size] = value
+            self.__size += 1
+        self.__buffering = False
+
+    def update(self, value):
+        if not self.__buffering:
+            self.append(value)
+            self.__buffering = True
+        else:
+            self.__values[self.__size - 1] = value
+
+    def extend(self, values):
+        assert not self.__buffering, "can not extend while buffering"
+        self.__reserve(self.__size + len(values))
+        self.__values[self.__size:self.__size + len(values)] = values
+        self.__size += len(values)
+
+    def prepend(self, values):
+        count = len(values)
+        self.__reserve(self.__size + count)
+        self.__values[count:self.__size + count] = self.__values[:self.__size]
+        self.__values[:count] = values
+        self.__size += count
+
+
+class BufferedDateTimeList(BufferedNumPyList):
+    """A BufferedNumPyList of datetime64[s] (int64 seconds since the epoch) that takes and returns the same datetime
+    representation it was given: datetime.datetime, or 'YYYY-MM-DD' / 'YYYY-MM-DD HH:MM:SS' strings."""
+
+    def __init__(self, capacity=16):
+        super().__init__('datetime64[s]', capacity)
+        self.__dateOnly = None
+        # The series checks the last datetime on every append, so keep it as it was given.
+        self.__last = None
+
+    def __detect(self, first):
+        # The first datetime decides how datetimes are returned.
+        self.__isStr = isinstance(first, str)
+        self.__dateOnly = self.__isStr and len(first) == 10
+
+    def __toArray(self, dateTimes):
+        if self.__dateOnly is None and len(dateTimes):
+            self.__detect(dateTimes[0])
+        return np.array(dateTimes, dtype='datetime64[s]')
+
+    def __toValue(self, dateTime):
+        if self.__dateOnly is None:
+            self.__detect(dateTime)
+        return np.datetime64(dateTime, 's')
+
+    def __fromValue(self, value):
+        if not self.__isStr:
+            return value.item()
+        ret = str(np.datetime_as_string(value, unit='D' if self.__dateOnly else 's'))
+        return ret if self.__dateOnly else ret.replace('T', ' ')
+
+    def __getitem__(self, item):
+        if item == -1 and len(self):
+            return self.__last
+        ret = self.data()[item]
+        if isinstance(item, slice):
+            return [self.__fromValue(value) for value in ret]
+        return self.__fromValue(ret)
+
+    def __iter__(self):
+        return (self.__fromValue(value) for value in self.data())
+
+    def asarray(self):
+        return self.data()
+
+    def append(self, value):
+        super().append(self.__toValue(value))
+        self.__last = value
+
+    def update(self, value):
+        super().update(self.__toValue(value))
+        self.__last = value
+
+    def extend(self, values):
+        super().extend(self.__toArray(values))
+        if len(values):
+            self.__last = values[-1]
+
+    def prepend(self, values):
+        super().prepend(self.__toArray(values))
+        if self.__last is None and len(values):
+            self.__last = values[-1]
+
 
 class BufferedNumPyDeque:
+    # Same layout as NumPyDeque. A buffered value takes a slot in the window until it is committed or replaced.
     def __init__(self, maxLen, dtype=float):
         assert maxLen > 0, "Invalid maximum length"
 
-        self.__values = np.empty(maxLen, dtype=dtype)
+        self.__values = np.empty(2 * maxLen, dtype=dtype)
         self.__maxLen = maxLen
-        self.__nextPos = 0
+        self.__start = 0
+        self.__end = 0
         self.__buffering = False
 
     def __len__(self):
-        return self.__nextPos
+        return self.__end - self.__start
 
     def __getitem__(self, item):
-        return self.__data[item]
+        return self.data()[item]
 
     def __iter__(self):
-        return iter(self.__data)
+        return iter(self.data())
 
     def __str__(self):
-        return str(self.__data)
+        return str(self.data())
 
     @property
     def maxLen(self):
@@ -204,31 +413,31 @@ class BufferedNumPyDeque:
     def isBuffering(self):
         return self.__buffering
 
-    @property
-    def __data(self):
-        # If all values are not initialized, return a portion of the array.
-        if self.__nextPos < self.__maxLen:
-            ret = self.__values[0:self.__nextPos]
-        else:
-            ret = self.__values
-        return ret
-    
+    def data(self):
+        """Returns a view of the values in the window, oldest first. Do not modify it."""
+        return self.__values[self.__start:self.__end]
+
+    def __push(self, value):
+        if self.__end == len(self.__values):
+            size = self.__end - self.__start
+            self.__values[0:size] = self.__values[self.__start:self.__end]
+            self.__start = 0
+            self.__end = size
+        self.__values[self.__end] = value
+        self.__end += 1
+        if self.__end - self.__start > self.__maxLen:
+            self.__start += 1
+
     def append(self, value):
         if self.__buffering:
-            self.__data[-1] = value
+            self.__values[self.__end - 1] = value
         else:
-            if self.__nextPos < self.__maxLen:
-                self.__values[self.__nextPos] = value
-                self.__nextPos +=1
-            else:
-                #queue is full
-                self.__values[0:-1] = self.__values[1:]
-                self.__values[self.__nextPos-1] = value
+            self.__push(value)
         self.__buffering = False
 
     def update(self,value):
         if not self.__buffering:
-            self.append(value)
+            self.__push(value)
             self.__buffering = True
         else:
-            self.__data[-1] = value
+            self.__values[self.__end - 1] = value
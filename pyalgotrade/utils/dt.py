@@ -53,7 +53,9 @@ def as_utc(dateTime):
 
 
 def datetime_to_timestamp(dateTime):
-    """ Converts a datetime.datetime to a UTC timestamp."""
+    """ Converts a datetime.datetime, or a 'YYYY-MM-DD[ HH:MM:SS]' string as used by the stock package, to a UTC timestamp."""
+    if isinstance(dateTime, str):
+        dateTime = datetime.datetime.fromisoformat(dateTime)
     diff = as_utc(dateTime) - epoch_utc
     return diff.total_seconds()
 
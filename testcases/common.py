@@ -0,0 +1,24 @@
+import numpy as np
+
+from pyalgotrade.stock.bar import Bar
+
+
+def build_bars(dateTimes, frequency, volume=100):
+    # Bars with distinct prices so that merging mistakes show up in open/high/low/close.
+    ret = []
+    for i, dateTime in enumerate(dateTimes):
+        price = 10. + i / 10.
+        ret.append(Bar(dateTime, price, price + 0.5, price - 0.5, price + 0.1, volume + i, frequency))
+    return ret
+
+
+def to_quote(bars):
+    # Same layout as sina.Quoter.parseIntraDayQuote.
+    return {
+        'day': np.array([bar.dateTime for bar in bars], dtype='datetime64[s]'),
+        'open': np.array([bar.open for bar in bars], dtype=float),
+        'high': np.array([bar.high for bar in bars], dtype=float),
+        'low': np.array([bar.low for bar in bars], dtype=float),
+        'close': np.array([bar.close for bar in bars], dtype=float),
+        'volume': np.array([bar.volume for bar in bars], dtype=np.int64),
+    }
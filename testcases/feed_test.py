@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+from pyalgotrade import asyncdispatcher
+from pyalgotrade.feed import BaseLiveFeed
+from pyalgotrade.stock import Stock
+from pyalgotrade.stock.bar import Bar, Frequency
+
+
+class SlowFetchFeed(BaseLiveFeed):
+    # 'slow' only answers once the bar of 'fast' was emitted, or after a timeout.
+    TIMEOUT = 5
+
+    def __init__(self):
+        super().__init__()
+        self.fastEmitted = threading.Event()
+        self.slowDone = threading.Event()
+        self.processed = []
+
+    def fetchBarData(self, code, frequency):
+        if code == 'slow':
+            self.fastEmitted.wait(SlowFetchFeed.TIMEOUT)
+            self.slowDone.set()
+        return code
+
+    def getNextBar(self, code, frequency, data):
+        self.processed.append(code)
+        return Bar('2018-09-10 09:35:00', 10., 10., 10., 10., 100, frequency), True
+
+
+class BaseLiveFeedTestCase(unittest.TestCase):
+    def testBarsAreDispatchedAsResponsesArrive(self):
+        feed = SlowFetchFeed()
+        feed.addStock(Stock('fast', periods=(Frequency.FIVE_MINUTE,)))
+        feed.addStock(Stock('slow', periods=(Frequency.FIVE_MINUTE,)))
+        dispatcher = asyncdispatcher.AsyncDispatcher()
+        dispatcher.addSubject(feed)
+        # (code, whether the slow fetch had finished) for every emitted bar.
+        emitted = []
+
+        def onBar(dateTime, bar):
+            code = feed.processed[-1]
+            emitted.append((code, feed.slowDone.is_set()))
+            if code == 'fast':
+                feed.fastEmitted.set()
+            else:
+                dispatcher.stop()
+
+        feed.getNewValuesEvent().subscribe(onBar)
+        dispatcher.run()
+        self.assertEqual(emitted, [('fast', False), ('slow', True)])
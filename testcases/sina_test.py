@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+from pyalgotrade.stock import Stock, sina
+from pyalgotrade.stock.bar import Frequency
+from testcases import common
+
+
+def day(*times):
+    return ['2018-09-10 %s' % time for time in times]
+
+
+class LiveFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stock = Stock('600000', periods=(Frequency.FIVE_MINUTE,))
+        self.stock.extend(common.build_bars(day('09:35:00', '09:40:00'), Frequency.FIVE_MINUTE), True)
+        self.feed = sina.LiveFeed(maxWorkers=1)
+        self.feed.addStock(self.stock)
+        self.feed.start()
+        self.reply = []
+
+    def tearDown(self):
+        self.feed.stop()
+
+    def __getIntraDayQuote(self, code, period, timeout=5, datalen=sina.Quoter.MAX_DATALEN):
+        return common.to_quote(self.reply[-datalen:])
+
+    def __dispatch(self, reply):
+        self.reply = reply
+        with mock.patch.object(sina.Quoter, 'getIntraDayQuote', self.__getIntraDayQuote):
+            return self.feed.dispatch()
+
+    def testMissedPoll(self):
+        series = self.stock[Frequency.FIVE_MINUTE]
+        buffered = series[-1]
+        # The poll that would have seen 09:45 start was missed, so 09:40 is not in the reply.
+        bars = common.build_bars(day('09:30:00', '09:35:00', '09:40:00', '09:45:00', '09:50:00'), Frequency.FIVE_MINUTE)
+        self.assertTrue(self.__dispatch(bars))
+        self.assertEqual(list(series.dateTimes), day('09:35:00', '09:40:00', '09:45:00', '09:50:00'))
+        self.assertTrue(series[1] is buffered)
+        self.assertEqual(str(series[2]), str(bars[3]))
+        self.assertTrue(series.isBuffering())
+
+        # The feed keeps updating the newest bar.
+        updated = common.build_bars(day('09:45:00', '09:50:00'), Frequency.FIVE_MINUTE, volume=500)
+        self.assertTrue(self.__dispatch(updated))
+        self.assertEqual(len(series), 4)
+        self.assertEqual(str(series[-1]), str(updated[-1]))
+
+    def testSingleBarReply(self):
+        # Right after the open there is only one bar in the reply.
+        series = self.stock[Frequency.FIVE_MINUTE]
+        bars = common.build_bars(day('09:45:00'), Frequency.FIVE_MINUTE)
+        self.assertTrue(self.__dispatch(bars))
+        self.assertEqual(list(series.dateTimes), day('09:35:00', '09:40:00', '09:45:00'))
+        self.assertTrue(series.isBuffering())
+
+    def testEmptyReply(self):
+        series = self.stock[Frequency.FIVE_MINUTE]
+        self.assertFalse(self.__dispatch([]))
+        self.assertEqual(list(series.dateTimes), day('09:35:00', '09:40:00'))
@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from pyalgotrade import stock
+from pyalgotrade.stock import sina
+from pyalgotrade.stock.bar import Bar, Frequency
+from testcases import common
+
+
+PREVIOUS_DAY = ['2018-09-07 14:50:00', '2018-09-07 14:55:00', '2018-09-07 15:00:00']
+TODAY = ['2018-09-10 09:35:00', '2018-09-10 09:40:00', '2018-09-10 09:45:00', '2018-09-10 09:50:00',
+         '2018-09-10 09:55:00', '2018-09-10 10:00:00', '2018-09-10 10:05:00', '2018-09-10 10:10:00',
+         '2018-09-10 10:15:00']
+
+
+def merge_all(bars, dateTime, frequency):
+    return Bar(dateTime, bars[0].open, max(bar.high for bar in bars), min(bar.low for bar in bars), bars[-1].close,
+               sum(bar.volume for bar in bars), frequency)
+
+
+def assert_bar_equal(testCase, bar, expected):
+    testCase.assertEqual(str(bar), str(expected))
+
+
+class DerivedPeriodsTestCase(unittest.TestCase):
+    def setUp(self):
+        fiveMinute = common.build_bars(PREVIOUS_DAY + TODAY, Frequency.FIVE_MINUTE)
+        self.today = fiveMinute[len(PREVIOUS_DAY):]
+        # Partial bars as the data sources return them while 10:15 is still in progress.
+        self.quotes = {
+            Frequency.FIVE_MINUTE: fiveMinute,
+            Frequency.HOUR: [merge_all(fiveMinute[:len(PREVIOUS_DAY)], '2018-09-07 15:00:00', Frequency.HOUR),
+                             merge_all(self.today, '2018-09-10 10:30:00', Frequency.HOUR)],
+        }
+        self.dayBars = [Bar('2018-09-07', 9., 9.5, 8.5, 9.2, 5000, Frequency.DAY),
+                        merge_all(self.today, '2018-09-10', Frequency.DAY)]
+        self.requested = {}
+
+    def __getIntraDayQuote(self, code, period, timeout=5, datalen=sina.Quoter.MAX_DATALEN):
+        frequency = period * 60
+        self.requested[frequency] = datalen
+        return common.to_quote(self.quotes[frequency][-datalen:])
+
+    def __loadLatestDayDataToStock(self, stock_, count, end_date=None, bufferLast=False):
+        stock_.extend(self.dayBars[-count:], bufferLast)
+
+    def __loadStock(self):
+        ret = stock.Stock('600000', periods=(Frequency.FIVE_MINUTE, Frequency.HOUR, Frequency.DAY))
+        with mock.patch.object(sina.Quoter, 'getIntraDayQuote', self.__getIntraDayQuote), \
+                mock.patch.object(stock.DBInterface, 'loadLatestDayDataToStock', self.__loadLatestDayDataToStock):
+            ret.loadData(lazy=True)
+        return ret
+
+    def testLazyLoadKeepsDerivedBars(self):
+        stock_ = self.__loadStock()
+        self.assertGreaterEqual(self.requested[Frequency.FIVE_MINUTE], len(self.today))
+        self.assertEqual(len(stock_[Frequency.HOUR]), 1)
+
+        # The in-progress 5 minute bar goes on.
+        last = self.today[-1]
+        updated = Bar(last.dateTime, last.open, last.high + 1, last.low - 1, last.close, last.volume + 50,
+                      Frequency.FIVE_MINUTE)
+        stock_.update(updated)
+        today = self.today[:-1] + [updated]
+        assert_bar_equal(self, stock_[Frequency.HOUR][-1], merge_all(today, '2018-09-10 10:30:00', Frequency.HOUR))
+        assert_bar_equal(self, stock_[Frequency.DAY][-1], merge_all(today, '2018-09-10', Frequency.DAY))
+        self.assertTrue(stock_[Frequency.HOUR].isBuffering())
+
+        # Next 5 minute bar.
+        stock_.append(updated)
+        nextBar = common.build_bars(['2018-09-10 10:20:00'], Frequency.FIVE_MINUTE, volume=7)[0]
+        stock_.update(nextBar)
+        today.append(nextBar)
+        assert_bar_equal(self, stock_[Frequency.HOUR][-1], merge_all(today, '2018-09-10 10:30:00', Frequency.HOUR))
+        assert_bar_equal(self, stock_[Frequency.DAY][-1], merge_all(today, '2018-09-10', Frequency.DAY))